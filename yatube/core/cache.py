@@ -0,0 +1,283 @@
+"""Двухуровневый кеш: LRU в памяти процесса перед общим бэкендом.
+
+L1 — небольшой LRU внутри процесса, L2 — общий для всех процессов кеш
+(файловый, базы данных и т.п.), указанный алиасом из `CACHES`.
+Каждая запись кладёт изменённые ключи одним списком в журнал
+инвалидации под следующим свободным номером. Номер занимается
+атомарным `add`, поэтому два процесса не перезаписывают записи друг
+друга; штамп в журнале —
+лишь подсказка, с какого номера искать. Не чаще раза в `SYNC_INTERVAL`
+секунд процесс дочитывает журнал и выбрасывает из L1 ключи, изменённые
+другими процессами; если журнал потерян, L1 очищается целиком.
+
+Журнал хранится в отдельном кеше (`LOG`), чтобы вытеснение страниц
+не удаляло его записи.
+"""
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+STAMP_KEY = 'two-tier:stamp'
+LOG_KEY = 'two-tier:log:{}'
+# Запись журнала, по которой все процессы очищают L1 целиком.
+CLEAR_ALL = '*'
+LOG_WINDOW = 16
+CULL_CHECK_EVERY = 100
+
+
+class AtomicFileBasedCache(FileBasedCache):
+    """Файловый кеш с атомарным `add`: для L2 и журнала инвалидации.
+
+    Запись готовится во временном файле и ставится на место жёсткой
+    ссылкой: `link` не перезаписывает существующий файл, поэтому из
+    двух процессов номер достаётся одному. При переполнении сначала
+    удаляются истёкшие записи.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    if self._alive(fname):
+                        return False
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def _alive(self, fname):
+        """Есть ли неистёкшая запись; истёкшая удаляется."""
+        try:
+            with open(fname, 'rb') as f:
+                return not self._is_expired(f)
+        except FileNotFoundError:
+            return False
+
+    def _cull(self):
+        # Обход каталога дорог, а записей между переполнениями много:
+        # проверять переполнение достаточно раз в `CULL_CHECK_EVERY` записей.
+        self._writes = getattr(self, '_writes', 0) + 1
+        if self._writes % CULL_CHECK_EVERY:
+            return
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries:
+            return
+        for fname in filelist:
+            self._alive(fname)
+        super()._cull()
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', location)
+        self._log_alias = options.get('LOG', self._l2_alias)
+        self._l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self._l1_timeout = options.get('L1_TIMEOUT', 30)
+        self._sync_interval = options.get('SYNC_INTERVAL', 1)
+        self._log_timeout = options.get('LOG_TIMEOUT', 5 * 60)
+        self._l1 = OrderedDict()
+        self._lock = threading.RLock()
+        self._seen_stamp = None
+        self._synced_at = 0
+        self._stats = dict.fromkeys(
+            ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses'), 0
+        )
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    @property
+    def log(self):
+        return caches[self._log_alias]
+
+    # L1
+
+    def _l1_get(self, key):
+        with self._lock:
+            value, expires_at = self._l1.get(key, (None, 0))
+            if expires_at <= time.monotonic():
+                self._l1.pop(key, None)
+                self._stats['l1_misses'] += 1
+                return False, None
+            self._l1.move_to_end(key)
+            self._stats['l1_hits'] += 1
+        # Как и LocMemCache, храним копии: иначе изменение полученного
+        # объекта (например, заголовков ответа) испортит кеш.
+        return True, pickle.loads(value)
+
+    def _l1_set(self, key, value, timeout):
+        ttl = self._l1_timeout
+        if timeout is not None:
+            if timeout is DEFAULT_TIMEOUT:
+                timeout = self.default_timeout
+            ttl = min(ttl, timeout) if timeout is not None else ttl
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1[key] = (value, time.monotonic() + ttl)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_evict(self, keys):
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    # Межпроцессная инвалидация
+
+    def _publish(self, *keys):
+        if not keys:
+            return
+        stamp = (self.log.get(STAMP_KEY) or 0) + 1
+        while not self.log.add(LOG_KEY.format(stamp), list(keys),
+                               self._log_timeout):
+            stamp += 1
+        self.log.set(STAMP_KEY, stamp, None)
+
+    def _read_log(self, seen):
+        """Ключи из непрерывного участка журнала после `seen`."""
+        changed, stamp = [], seen
+        while True:
+            numbers = range(stamp + 1, stamp + LOG_WINDOW + 1)
+            found = self.log.get_many([LOG_KEY.format(n) for n in numbers])
+            for number in numbers:
+                keys = found.get(LOG_KEY.format(number))
+                if keys is None:
+                    return changed, stamp
+                changed.extend(keys)
+                stamp = number
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._synced_at < self._sync_interval:
+            return
+        self._synced_at = now
+        hint = self.log.get(STAMP_KEY) or 0
+        if self._seen_stamp is None or hint < self._seen_stamp:
+            # Первая сверка или журнал начат заново.
+            self._clear_l1()
+            self._seen_stamp = hint
+        changed, stamp = self._read_log(self._seen_stamp)
+        if stamp < hint or CLEAR_ALL in changed:
+            # Часть журнала истекла или вытеснена.
+            self._clear_l1()
+        else:
+            self._l1_evict(changed)
+        self._seen_stamp = max(stamp, hint)
+
+    def _clear_l1(self):
+        with self._lock:
+            self._l1.clear()
+
+    # API кеша
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        l1_key = self.make_key(key, version)
+        found, value = self._l1_get(l1_key)
+        if found:
+            return value
+        value = self.l2.get(key, self, version=version)
+        if value is self:
+            self._stats['l2_misses'] += 1
+            return default
+        self._stats['l2_hits'] += 1
+        self._l1_set(l1_key, value, DEFAULT_TIMEOUT)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        result, missing = {}, []
+        for key in keys:
+            found, value = self._l1_get(self.make_key(key, version))
+            if found:
+                result[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            from_l2 = self.l2.get_many(missing, version=version)
+            self._stats['l2_hits'] += len(from_l2)
+            self._stats['l2_misses'] += len(missing) - len(from_l2)
+            for key, value in from_l2.items():
+                self._l1_set(self.make_key(key, version), value,
+                             DEFAULT_TIMEOUT)
+            result.update(from_l2)
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        l1_key = self.make_key(key, version)
+        self._l1_set(l1_key, value, timeout)
+        self._publish(l1_key)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version)
+        l1_keys = []
+        for key, value in data.items():
+            if key not in failed:
+                l1_keys.append(self.make_key(key, version))
+                self._l1_set(l1_keys[-1], value, timeout)
+        self._publish(*l1_keys)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            l1_key = self.make_key(key, version)
+            self._l1_set(l1_key, value, timeout)
+            self._publish(l1_key)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        l1_key = self.make_key(key, version)
+        self._l1_evict([l1_key])
+        self._publish(l1_key)
+        return value
+
+    def delete(self, key, version=None):
+        self.l2.delete(key, version=version)
+        l1_key = self.make_key(key, version)
+        self._l1_evict([l1_key])
+        self._publish(l1_key)
+
+    def has_key(self, key, version=None):
+        self._sync()
+        found, value = self._l1_get(self.make_key(key, version))
+        return found or self.l2.has_key(key, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def clear(self):
+        self.l2.clear()
+        self._clear_l1()
+        self._publish(CLEAR_ALL)
+
+    def tier_stats(self):
+        """Попадания и промахи каждого уровня и их доли попаданий."""
+        stats = dict(self._stats)
+        for tier in ('l1', 'l2'):
+            total = stats[f'{tier}_hits'] + stats[f'{tier}_misses']
+            stats[f'{tier}_hit_ratio'] = (
+                stats[f'{tier}_hits'] / total if total else 0.0
+            )
+        return stats
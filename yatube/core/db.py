@@ -0,0 +1,25 @@
+"""Настройка соединений SQLite при их открытии.
+
+`SQLITE_PRAGMAS` применяются к каждому новому соединению с SQLite.
+WAL позволяет читать во время записи, `synchronous=NORMAL` в режиме WAL
+не теряет целостность и не ждёт fsync на каждом коммите, а
+`busy_timeout` заставляет писателей ждать блокировку, а не падать с
+«database is locked». Вместе с `CONN_MAX_AGE` соединение и его кеш
+страниц переиспользуются между запросами.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, getattr(settings, 'SQLITE_PRAGMAS', {}))
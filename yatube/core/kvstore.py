@@ -0,0 +1,35 @@
+"""Хранилище метаданных sorl-thumbnail с пакетным чтением.
+
+Основа — `cached_db` из sorl: запись идёт в базу и сразу в кеш, чтение
+сначала из кеша. `get_many` достаёт метаданные целой страницы одним
+`get_many` кеша и одним запросом к базе на все промахи; отсутствие
+записи тоже кешируется, чтобы не спрашивать базу повторно.
+"""
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+EMPTY_VALUE = cached_db_kvstore.EMPTY_VALUE
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    def get_many(self, image_files):
+        """Записи для `image_files` в том же порядке; None, если нет."""
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            stored = dict(
+                KVStoreModel.objects.filter(key__in=missing)
+                .values_list('key', 'value')
+            )
+            loaded = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(loaded, settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(loaded)
+        return [
+            None if found[key] == EMPTY_VALUE
+            else deserialize_image_file(found[key])
+            for key in keys
+        ]
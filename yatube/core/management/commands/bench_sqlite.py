@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER, '
+    'text TEXT, pub_date REAL)',
+    'CREATE INDEX post_author_pub_date ON post (author_id, pub_date)',
+    'CREATE TABLE stats (author_id INTEGER PRIMARY KEY, posts INTEGER)',
+)
+AUTHORS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения и записи SQLite с '
+        'настройками по умолчанию (новое соединение на каждый запрос) и с '
+        'SQLITE_PRAGMAS и постоянными соединениями. Нагрузка идёт на '
+        'временную базу со схемой, похожей на посты, база проекта не '
+        'затрагивается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=3,
+                            help='Длительность каждого режима в секундах')
+        parser.add_argument('--rows', type=int, default=5000,
+                            help='Постов в базе перед замером')
+
+    def create_database(self, path, rows):
+        connection = sqlite3.connect(path)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.executemany(
+            'INSERT INTO post (author_id, text, pub_date) VALUES (?, ?, ?)',
+            ((number % AUTHORS, f'Пост {number}', number)
+             for number in range(rows))
+        )
+        connection.executemany(
+            'INSERT INTO stats VALUES (?, ?)',
+            ((author_id, rows // AUTHORS) for author_id in range(AUTHORS))
+        )
+        connection.commit()
+        connection.close()
+
+    def connect(self, path, pragmas):
+        connection = sqlite3.connect(path, isolation_level=None,
+                                     check_same_thread=False)
+        apply_pragmas(connection.cursor(), pragmas)
+        return connection
+
+    def read(self, connection, number):
+        author_id = number % AUTHORS
+        connection.execute(
+            'SELECT id, text FROM post WHERE author_id = ? '
+            'ORDER BY pub_date DESC LIMIT 10', (author_id,)
+        ).fetchall()
+        connection.execute(
+            'SELECT posts FROM stats WHERE author_id = ?', (author_id,)
+        ).fetchone()
+
+    def write(self, connection, number):
+        # Как `post_create` без ATOMIC_REQUESTS: каждый запрос сигналов
+        # выполняется в своей автоматической транзакции.
+        author_id = number % AUTHORS
+        connection.execute(
+            'SELECT posts FROM stats WHERE author_id = ?', (author_id,)
+        ).fetchone()
+        connection.execute(
+            'INSERT INTO post (author_id, text, pub_date) VALUES (?, ?, ?)',
+            (author_id, 'Новый пост', time.time())
+        )
+        connection.execute(
+            'UPDATE stats SET posts = posts + 1 WHERE author_id = ?',
+            (author_id,)
+        )
+
+    def worker(self, operation, path, pragmas, persistent, deadline, result):
+        done = errors = number = 0
+        connection = self.connect(path, pragmas) if persistent else None
+        while time.monotonic() < deadline:
+            number += 1
+            current = connection or self.connect(path, pragmas)
+            try:
+                operation(current, number)
+                done += 1
+            except sqlite3.OperationalError:
+                errors += 1
+            finally:
+                if not persistent:
+                    current.close()
+        if connection is not None:
+            connection.close()
+        result.append((done, errors))
+
+    def run_mode(self, pragmas, persistent, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            self.create_database(path, options['rows'])
+            self.connect(path, pragmas).close()
+            deadline = time.monotonic() + options['duration']
+            reads, writes, threads = [], [], []
+            for operation, result, count in (
+                (self.read, reads, options['readers']),
+                (self.write, writes, options['writers']),
+            ):
+                threads.extend(
+                    threading.Thread(target=self.worker, args=(
+                        operation, path, pragmas, persistent, deadline,
+                        result
+                    ))
+                    for _ in range(count)
+                )
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return [
+            (sum(done for done, errors in result) / options['duration'],
+             sum(errors for done, errors in result))
+            for result in (reads, writes)
+        ]
+
+    def handle(self, *args, **options):
+        modes = (
+            ('по умолчанию', {}, False),
+            ('WAL + pragmas', settings.SQLITE_PRAGMAS, True),
+        )
+        self.stdout.write(
+            f'{"режим":<16} {"чтений/с":>10} {"ошибок":>8} '
+            f'{"записей/с":>10} {"ошибок":>8}'
+        )
+        for name, pragmas, persistent in modes:
+            (reads, read_errors), (writes, write_errors) = self.run_mode(
+                pragmas, persistent, options
+            )
+            self.stdout.write(
+                f'{name:<16} {reads:>10.0f} {read_errors:>8} '
+                f'{writes:>10.0f} {write_errors:>8}'
+            )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файлы реплик из DATABASE_REPLICAS. '
+        'С --interval повторяет копирование, изображая отстающую реплику.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Период копирования в секундах')
+
+    def handle(self, *args, **options):
+        while True:
+            for alias in replicas.replica_aliases():
+                replicas.sync(alias)
+                self.stdout.write(f'Реплика {alias} обновлена')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
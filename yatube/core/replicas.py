@@ -0,0 +1,144 @@
+"""Чтение с реплик, запись в основную базу.
+
+`PrimaryReplicaRouter` отправляет запись в `default`, а чтение — на
+случайную реплику из `DATABASE_REPLICAS`. Чтобы пользователь видел
+свои изменения, чтение идёт в основную базу:
+
+* до конца запроса, в котором уже была запись;
+* ещё `REPLICA_PIN_SECONDS` после него — по куке `PIN_COOKIE`;
+* внутри транзакции основной базы.
+
+Страницы, которые кешируются надолго, пересчитываются в
+`consistent_reads()`: там годятся только реплики, скопированные после
+последней записи, иначе чтение идёт в основную базу. Локально реплика —
+копия файла SQLite, которую обновляет команда `sync_replicas`.
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_primary'
+LAST_WRITE_KEY = 'replicas:last-write'
+SYNCED_KEY = 'replicas:synced:{}'
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def note_write():
+    cache.set(LAST_WRITE_KEY, time.time(), None)
+
+
+def mark_synced(alias, started):
+    cache.set(SYNCED_KEY.format(alias), started, None)
+
+
+def copy_database(source, target_name):
+    """Копирует базу SQLite через backup API, не останавливая запись."""
+    target = sqlite3.connect(target_name)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+
+
+def sync(alias):
+    started = time.time()
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    copy_database(primary.connection, connections[alias].settings_dict['NAME'])
+    mark_synced(alias, started)
+
+
+def fresh_replicas():
+    """Реплики, скопированные после последней записи в основную базу."""
+    aliases = replica_aliases()
+    last_write = cache.get(LAST_WRITE_KEY, 0)
+    synced = cache.get_many([SYNCED_KEY.format(alias) for alias in aliases])
+    return [
+        alias for alias in aliases
+        if synced.get(SYNCED_KEY.format(alias), -1) > last_write
+    ]
+
+
+def start_request(pinned=False, in_request=False):
+    _state.pinned = pinned
+    _state.wrote = False
+    _state.candidates = None
+    _state.in_request = in_request
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+@contextmanager
+def consistent_reads():
+    """Чтение внутри блока видит все завершённые записи."""
+    previous = getattr(_state, 'candidates', None)
+    _state.candidates = fresh_replicas()
+    try:
+        yield
+    finally:
+        _state.candidates = previous
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (getattr(_state, 'pinned', False) or wrote()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        candidates = getattr(_state, 'candidates', None)
+        if candidates is None:
+            candidates = replica_aliases()
+        return random.choice(candidates) if candidates else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        if replica_aliases() and not getattr(_state, 'in_request', False):
+            # Записи запроса отмечает middleware после ответа, а здесь —
+            # записи команд и воркеров.
+            note_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплики вместе с копией основной базы.
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class PrimaryPinMiddleware:
+    """Закрепляет чтение за основной базой после записи пользователя."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_request(pinned=PIN_COOKIE in request.COOKIES, in_request=True)
+        try:
+            response = self.get_response(request)
+            if wrote():
+                # Записи запроса уже зафиксированы: отметка позже любой
+                # из них.
+                if replica_aliases():
+                    note_write()
+                response.set_cookie(
+                    PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True, samesite='Lax'
+                )
+        finally:
+            start_request()
+        return response
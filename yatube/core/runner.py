@@ -0,0 +1,31 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TemporaryCacheRunner(DiscoverRunner):
+    """Запускает тесты с файловыми кешами во временном каталоге.
+
+    Тесты очищают кеш, и с рабочим `BASE_DIR/cache` это стирало бы кеш
+    запущенного рядом сервера.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp(prefix='yatube-cache-')
+        caches = copy.deepcopy(settings.CACHES)
+        for alias, params in caches.items():
+            if os.path.isabs(params.get('LOCATION', '')):
+                params['LOCATION'] = os.path.join(self._cache_dir, alias)
+        self._cache_settings = override_settings(CACHES=caches)
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,133 @@
+import os
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from ..cache import LOG_KEY, STAMP_KEY, TwoTierCache
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.log = caches['invalidation']
+        self.tearDown()
+        # Два экземпляра с общим L2 ведут себя как два процесса.
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+
+    def tearDown(self):
+        caches['shared'].clear()
+        caches['invalidation'].clear()
+
+    def make_cache(self, **options):
+        options = {'LOG': 'invalidation', 'SYNC_INTERVAL': 0, **options}
+        return TwoTierCache('shared', {'OPTIONS': options})
+
+    def test_value_is_read_through_and_kept_in_l1(self):
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        stats = self.second.tier_stats()
+        self.assertEqual(stats['l2_hits'], 1)
+        self.assertEqual(stats['l1_hits'], 1)
+        self.assertEqual(stats['l1_hit_ratio'], 0.5)
+
+    def test_writes_invalidate_other_processes(self):
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+
+    def test_incr_is_visible_to_other_processes(self):
+        self.first.set('counter', 1)
+        self.assertEqual(self.second.get('counter'), 1)
+        self.first.incr('counter')
+        self.assertEqual(self.second.get('counter'), 2)
+
+    def test_lost_log_clears_l1(self):
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.log.delete_many(
+            [LOG_KEY.format(stamp) for stamp in range(1, 10)]
+        )
+        self.assertEqual(self.second.get('key'), 'new')
+
+    def test_l1_is_bounded_lru(self):
+        cache = self.make_cache(L1_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        self.assertEqual(list(cache._l1), [
+            cache.make_key('b'), cache.make_key('c')
+        ])
+
+    def test_returned_values_are_copies(self):
+        self.first.set('key', {'header': 'MISS'})
+        self.first.get('key')['header'] = 'HIT'
+        self.assertEqual(self.first.get('key'), {'header': 'MISS'})
+
+    def test_stale_stamp_does_not_overwrite_log(self):
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        # Штамп отстал: другой процесс ещё не записал свой номер.
+        self.log.set(STAMP_KEY, 0, None)
+        self.first.set('other', 'value')
+        self.assertEqual(self.log.get(LOG_KEY.format(2)),
+                         [self.first.make_key('other')])
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+
+    def test_set_many_writes_one_log_entry(self):
+        self.first.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(self.log.get(STAMP_KEY), 1)
+        self.assertEqual(
+            self.log.get(LOG_KEY.format(1)),
+            [self.first.make_key(key) for key in ('a', 'b', 'c')]
+        )
+        self.assertIsNone(self.log.get(LOG_KEY.format(2)))
+
+    def test_set_many_invalidates_every_key(self):
+        self.first.set_many({'a': 'old', 'b': 'old'})
+        self.assertEqual(self.second.get_many(['a', 'b']),
+                         {'a': 'old', 'b': 'old'})
+        self.first.set_many({'a': 'new', 'b': 'new'})
+        self.assertEqual(self.second.get_many(['a', 'b']),
+                         {'a': 'new', 'b': 'new'})
+
+    def test_clear_reaches_other_processes(self):
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.first.clear()
+        self.assertIsNone(self.second.get('key'))
+
+    def test_log_is_read_once_per_interval(self):
+        cache = self.make_cache(SYNC_INTERVAL=60)
+        cache.get('key')
+        with mock.patch.object(self.log, 'get') as get, \
+                mock.patch.object(self.log, 'get_many') as get_many:
+            cache.get('key')
+        get.assert_not_called()
+        get_many.assert_not_called()
+
+    def test_add_is_exclusive(self):
+        for alias in ('shared', 'invalidation'):
+            with self.subTest(alias=alias):
+                cache = caches[alias]
+                self.assertTrue(cache.add('entry', 'first'))
+                self.assertFalse(cache.add('entry', 'second'))
+                self.assertEqual(cache.get('entry'), 'first')
+                cache.set('expired', 'old', 1)
+                with mock.patch('time.time', return_value=time.time() + 5):
+                    self.assertTrue(cache.add('expired', 'new'))
+
+    def test_tests_do_not_use_project_cache(self):
+        project_cache = os.path.join(settings.BASE_DIR, 'cache')
+        for alias in ('shared', 'invalidation'):
+            with self.subTest(alias=alias):
+                self.assertFalse(
+                    caches[alias]._dir.startswith(project_cache)
+                )
@@ -0,0 +1,53 @@
+import io
+import os
+import sqlite3
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from ..db import apply_pragmas
+
+
+class SqlitePragmasTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_to_connection(self):
+        # Тестовая база в памяти не поддерживает WAL и mmap, остальные
+        # настройки проверяются на соединении Django.
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'),
+                         settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'),
+                         settings.SQLITE_PRAGMAS['cache_size'])
+
+    def test_file_database_switches_to_wal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = sqlite3.connect(os.path.join(directory, 'db.sqlite3'))
+            try:
+                apply_pragmas(database.cursor(), settings.SQLITE_PRAGMAS)
+                self.assertEqual(
+                    database.execute('PRAGMA journal_mode').fetchone()[0],
+                    'wal'
+                )
+            finally:
+                database.close()
+
+    def test_connections_are_persistent(self):
+        self.assertGreater(settings.DATABASES['default']['CONN_MAX_AGE'], 0)
+
+
+class BenchSqliteCommandTest(SimpleTestCase):
+    def test_reports_both_modes(self):
+        out = io.StringIO()
+        call_command('bench_sqlite', readers=1, writers=1, duration=0.2,
+                     rows=100, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('по умолчанию'))
+        self.assertTrue(lines[2].startswith('WAL + pragmas'))
@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Post, User
+
+from .. import replicas
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TransactionTestCase):
+    # В тестах реплика — зеркало основной базы. Данные должны быть
+    # зафиксированы, иначе соединение реплики их не увидит.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+        self.client = Client()
+        self.client.force_login(
+            User.objects.create_user(username='follower')
+        )
+        replicas.start_request()
+
+    def get(self, address, client=None):
+        """Ответ и количество запросов к реплике и к основной базе."""
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connections['default']) as primary:
+            response = (client or self.client).get(address)
+        return (response, len(replica.captured_queries),
+                len(primary.captured_queries))
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(Post.objects.all().db, 'replica')
+
+    def test_writes_go_to_primary(self):
+        self.assertEqual(
+            Post.objects.create(text='Новый', author=self.author)._state.db,
+            'default'
+        )
+
+    def test_reads_after_write_go_to_primary(self):
+        Post.objects.create(text='Новый', author=self.author)
+        self.assertEqual(Post.objects.all().db, 'default')
+
+    def test_reads_in_transaction_go_to_primary(self):
+        with transaction.atomic():
+            self.assertEqual(Post.objects.all().db, 'default')
+
+    def test_feed_is_read_from_replica(self):
+        replicas.mark_synced('replica', time.time())
+        response, replica_queries, primary_queries = self.get(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(replica_queries, 0)
+        self.assertEqual(primary_queries, 0)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_user_is_pinned_to_primary_after_write(self):
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Комментарий'}
+        )
+        cookie = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+        response, replica_queries, primary_queries = self.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(replica_queries, 0)
+        self.assertGreater(primary_queries, 0)
+
+    def test_pin_expires_with_cookie(self):
+        self.client.get(reverse('posts:profile_follow',
+                                kwargs={'username': 'author'}))
+        del self.client.cookies[replicas.PIN_COOKIE]
+        response, replica_queries, primary_queries = self.get(
+            reverse('posts:follow_index')
+        )
+        self.assertGreater(replica_queries, 0)
+
+    def test_other_users_are_not_pinned(self):
+        self.client.post(reverse('posts:post_create'),
+                         data={'text': 'Новый пост'})
+        reader = Client()
+        reader.force_login(User.objects.create_user(username='reader'))
+        replicas.start_request()
+        response, replica_queries, primary_queries = self.get(
+            reverse('posts:follow_index'), reader
+        )
+        self.assertGreater(replica_queries, 0)
+
+    def test_cached_pages_are_not_built_from_stale_replica(self):
+        replicas.mark_synced('replica', time.time())
+        replicas.note_write()
+        # Кешируются только страницы анонимных посетителей.
+        response, replica_queries, primary_queries = self.get(
+            reverse('posts:index'), Client()
+        )
+        self.assertEqual(replica_queries, 0)
+        self.assertGreater(primary_queries, 0)
+
+    def test_fresh_replicas(self):
+        replicas.note_write()
+        self.assertEqual(replicas.fresh_replicas(), [])
+        replicas.mark_synced('replica', time.time() + 1)
+        self.assertEqual(replicas.fresh_replicas(), ['replica'])
+
+
+class CopyDatabaseTest(TestCase):
+    def test_copy_is_a_consistent_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = sqlite3.connect(os.path.join(directory, 'primary'))
+            source.execute('CREATE TABLE post (text TEXT)')
+            source.execute("INSERT INTO post VALUES ('Пост')")
+            source.commit()
+            target_name = os.path.join(directory, 'replica')
+            replicas.copy_database(source, target_name)
+            source.execute("INSERT INTO post VALUES ('После копии')")
+            source.commit()
+            source.close()
+            target = sqlite3.connect(target_name)
+            self.assertEqual(
+                target.execute('SELECT text FROM post').fetchall(),
+                [('Пост',)]
+            )
+            target.close()
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib import admin
 
-from .models import Comment, Group, Post
+from . import search, thumbnails
+from .models import Comment, Group, Post, ThumbnailTask
 
 
 @admin.register(Post)
@@ -17,6 +19,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу FTS5 вместо `LIKE '%...%'` по всей таблице.
+        ids = search.match_ids(search_term)
+        if ids is None:
+            return queryset, False
+        return queryset.filter(pk__in=ids), False
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -32,4 +41,28 @@ class CommentAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
+@admin.register(ThumbnailTask)
+class ThumbnailTaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'post_id',
+        'attempts',
+        'failed',
+        'retry_at',
+        'last_error',
+        'created',
+    )
+    list_filter = ('attempts',)
+    actions = ('retry',)
+
+    def failed(self, task):
+        return task.attempts >= settings.THUMBNAIL_MAX_ATTEMPTS
+    failed.boolean = True
+    failed.short_description = 'Попытки исчерпаны'
+
+    def retry(self, request, queryset):
+        retried = thumbnails.retry(queryset)
+        self.message_user(request, f'Возвращено в очередь: {retried}')
+    retry.short_description = 'Повторить генерацию миниатюр'
+
+
 admin.site.register(Group)
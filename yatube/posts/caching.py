@@ -0,0 +1,257 @@
+"""Кеширование страниц с инвалидацией по версиям пространств имён.
+
+Копия страницы хранит версии её пространств имён (вся лента, группа,
+автор, пост). Запись в `Post`, `Group` или `Comment` увеличивает
+версию, и копия считается устаревшей, поэтому TTL может быть долгим.
+
+Кешируются только страницы для анонимных посетителей: они одинаковы
+для всех, поэтому ключ строится из пути и параметров страницы, а не
+из кук. Вошедшие пользователи видят свою шапку и формы с CSRF-токеном
+и всегда получают страницу из представления.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+
+from core.replicas import consistent_reads
+
+from . import sharding
+from .models import Group, Post, User
+
+VERSION_KEY = 'page-version:{}'
+POST_AUTHOR_KEY = 'page-post-author:{}'
+LOCK_KEY = 'page-lock:{}'
+PAGE_KEY = 'page:{}:{}'
+# Параметры запроса, от которых зависит страница; остальные (метки
+# рекламных кампаний и т. п.) не дробят кеш.
+KEY_PARAMS = ('page', 'cursor', 'q')
+STATS_KEY = 'page-stats:{}:{}'
+CACHE_HEADER = 'X-Cache'
+HIT, MISS, STALE = OUTCOMES = ('hit', 'miss', 'stale')
+
+_pending = Counter()
+_stats_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _new_version():
+    # Версия не повторяется даже после вытеснения ключа из кеша.
+    return time.time_ns()
+
+
+def versions(namespaces):
+    keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*namespaces):
+    for namespace in namespaces:
+        key = VERSION_KEY.format(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def invalidate_post_pages(post, old_group_id=None):
+    group_slugs = Group.objects.filter(
+        pk__in={post.group_id, old_group_id} - {None}
+    ).values_list('slug', flat=True)
+    bump(
+        'index',
+        f'post:{post.pk}',
+        f'author:{post.author.username}',
+        *(f'group:{slug}' for slug in group_slugs)
+    )
+
+
+def index_scope(request, *args, **kwargs):
+    return ['index']
+
+
+def group_scope(request, slug):
+    return ['groups', f'group:{slug}']
+
+
+def author_scope(request, username):
+    return ['groups', f'author:{username}']
+
+
+def _load_post_author(post_id):
+    if not sharding.enabled():
+        return Post.objects.filter(pk=post_id).values_list(
+            'author__username', flat=True
+        ).first()
+    # На шарде нет пользователей: автор читается из основной базы.
+    post = sharding.in_bulk(
+        [post_id], Post.objects.only('author_id')
+    ).get(post_id)
+    if post is None:
+        return None
+    return User.objects.filter(pk=post.author_id).values_list(
+        'username', flat=True
+    ).first()
+
+
+def post_author(post_id):
+    key = POST_AUTHOR_KEY.format(post_id)
+    username = cache.get(key)
+    if username is None:
+        username = _load_post_author(post_id)
+        cache.set(key, username, None)
+    return username
+
+
+def post_scope(request, post_id):
+    return ['groups', f'post:{post_id}', f'author:{post_author(post_id)}']
+
+
+def count_key(namespaces):
+    """Ключ числа постов ленты, сбрасываемый вместе с её страницами."""
+    return ':'.join(
+        f'{namespace}.{version}'
+        for namespace, version in zip(namespaces, versions(namespaces))
+    )
+
+
+def page_key(request, view_name):
+    """Ключ копии страницы: путь и значимые параметры запроса."""
+    params = sorted(
+        (name, value) for name in KEY_PARAMS
+        for value in request.GET.getlist(name)
+    )
+    digest = hashlib.md5(
+        repr((request.path, params)).encode()
+    ).hexdigest()
+    return PAGE_KEY.format(view_name, digest)
+
+
+def _should_cache(request, response):
+    if response.streaming or response.status_code != 200:
+        return False
+    # Куки и CSRF-токен в копии достались бы всем посетителям.
+    if response.cookies or request.META.get('CSRF_COOKIE_USED'):
+        return False
+    return 'private' not in response.get('Cache-Control', ())
+
+
+def view_settings(view_name):
+    """TTL и окно отдачи устаревшей копии из `PAGE_CACHE`."""
+    options = dict(settings.PAGE_CACHE['default'])
+    options.update(settings.PAGE_CACHE.get(view_name, {}))
+    return options['TTL'], options['GRACE']
+
+
+def record(view_name, outcome):
+    """Считает исход в памяти процесса, не трогая кеш на каждом ответе.
+
+    Накопленное переносится в общий кеш не чаще раза в
+    `PAGE_CACHE_STATS_INTERVAL` секунд.
+    """
+    with _stats_lock:
+        _pending[view_name, outcome] += 1
+        due = (time.monotonic() - _flushed_at
+               >= settings.PAGE_CACHE_STATS_INTERVAL)
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    global _flushed_at
+    with _stats_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    for (view_name, outcome), count in pending.items():
+        key = STATS_KEY.format(view_name, outcome)
+        if not cache.add(key, count, None):
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                pass
+
+
+def stats(view_name):
+    flush_stats()
+    keys = {STATS_KEY.format(view_name, outcome): outcome
+            for outcome in OUTCOMES}
+    found = cache.get_many(keys)
+    return {outcome: found.get(key, 0) for key, outcome in keys.items()}
+
+
+def acquire_lock(cache_key):
+    return cache.add(
+        LOCK_KEY.format(cache_key), 1, settings.PAGE_CACHE_LOCK_TIMEOUT
+    )
+
+
+def release_lock(cache_key):
+    cache.delete(LOCK_KEY.format(cache_key))
+
+
+def _serve(response, view_name, outcome):
+    record(view_name, outcome)
+    response[CACHE_HEADER] = outcome.upper()
+    return response
+
+
+def cache_versioned(scope, name=None):
+    """Замена `cache_page` с версиями, мягким TTL и single-flight.
+
+    Копия страницы свежа, пока не истёк TTL и не изменились версии
+    `scope`. Копию со сменившейся версией не отдают никому: после записи
+    страница всегда пересчитывается. Копию с истёкшим TTL (но в окне
+    GRACE) пересчитывает один запрос, захвативший блокировку, а
+    остальные в это время получают её. Запросы вошедших пользователей
+    идут мимо кеша.
+    """
+    def decorator(view):
+        view_name = name or view.__name__
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            ttl, grace = view_settings(view_name)
+            current = versions(scope(request, *args, **kwargs))
+            cache_key = page_key(request, view_name)
+            entry = cache.get(cache_key)
+            locked = False
+            if entry is not None and entry['versions'] == current:
+                if entry['fresh_until'] > time.time():
+                    return _serve(entry['response'], view_name, HIT)
+                locked = acquire_lock(cache_key)
+                if not locked:
+                    return _serve(entry['response'], view_name, STALE)
+            try:
+                # Копия живёт долго, поэтому её нельзя собирать с
+                # отстающей реплики.
+                with consistent_reads():
+                    response = view(request, *args, **kwargs)
+                if _should_cache(request, response):
+                    # Долгий TTL только у серверной копии: браузер при
+                    # каждом визите сверяет страницу по `ETag`.
+                    patch_cache_control(response, no_cache=True)
+                    cache.set(cache_key, {
+                        'response': response,
+                        'versions': current,
+                        'fresh_until': time.time() + ttl,
+                    }, ttl + grace)
+            finally:
+                if locked:
+                    release_lock(cache_key)
+            return _serve(response, view_name, MISS)
+        return wrapper
+    return decorator
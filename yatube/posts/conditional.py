@@ -0,0 +1,49 @@
+"""Условные GET для страниц поста, автора и группы.
+
+`ETag` страницы строится из версий её пространств имён в кеше страниц
+(`caching.versions`) и зрителя. Версии меняет любая запись, которую
+страница выводит: пост, комментарий, группа, подписка и сам
+пользователь, поэтому повторный визит получает `304 Not Modified` без
+запросов к базе, ещё до кеша страниц и сборки контекста шаблона.
+
+`Last-Modified` не выдаётся: удаление поста или комментария и подписка
+не сдвигают вперёд время изменения, и клиент с одним
+`If-Modified-Since` получал бы 304 на изменившуюся страницу.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.views.decorators.http import condition
+
+from . import caching
+
+
+def etag(versions, user):
+    payload = json.dumps([user.pk, versions])
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def conditional(scope):
+    """`condition` с `ETag` из версий пространств имён `scope`.
+
+    `scope` — та же функция, что у `cache_versioned`. Ответ, отличный
+    от 200, и устаревшая копия из кеша страниц уходят без `ETag`:
+    иначе браузер запомнил бы их под актуальным.
+    """
+    def get_etag(request, *args, **kwargs):
+        return etag(caching.versions(scope(request, *args, **kwargs)),
+                    request.user)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=get_etag)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if (response.status_code != 200 or response.get(
+                    caching.CACHE_HEADER) == caching.STALE.upper()):
+                del response['ETag']
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются `UPDATE ... SET x = x + 1` в обработчиках сигналов
+записи, а расхождения исправляет команда `reconcile_counters`.
+"""
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from . import sharding
+from .models import Comment, Follow, Post, User, UserStats
+
+USER_COUNTERS = {
+    'posts_count': (Post, 'author_id'),
+    'followers_count': (Follow, 'author_id'),
+    'following_count': (Follow, 'user_id'),
+}
+
+
+def stats_of(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def count_for_users(user_ids):
+    """Реальные значения счётчиков для пачки пользователей."""
+    counts = {
+        user_id: dict.fromkeys(USER_COUNTERS, 0) for user_id in user_ids
+    }
+    for field, (model, column) in USER_COUNTERS.items():
+        for alias in sharding.aliases(model):
+            rows = model.objects.using(alias).filter(
+                **{f'{column}__in': user_ids}
+            ).values(column).annotate(total=Count('pk')).values_list(
+                column, 'total'
+            )
+            for user_id, total in rows:
+                counts[user_id][field] += total
+    return counts
+
+
+def shifted(field, delta):
+    """`field + delta`, но не меньше нуля.
+
+    Разошедшийся счётчик (после `bulk_create` или `update()`) может
+    уже быть нулём, и уменьшение не должно нарушать CHECK столбца.
+    """
+    return Greatest(F(field) + delta, 0)
+
+
+def change_user_counter(user_id, field, delta):
+    updated = UserStats.objects.filter(pk=user_id).update(
+        **{field: shifted(field, delta)}
+    )
+    if not updated and User.objects.filter(pk=user_id).exists():
+        UserStats.objects.get_or_create(
+            user_id=user_id, defaults=count_for_users([user_id])[user_id]
+        )
+
+
+def change_comments_count(post_id, delta, using=None):
+    Post.objects.using(using).filter(pk=post_id).update(
+        comments_count=shifted('comments_count', delta)
+    )
+
+
+def reconcile_users(user_ids):
+    """Исправляет счётчики пачки пользователей, возвращает число правок."""
+    counts = count_for_users(user_ids)
+    stats = UserStats.objects.in_bulk(user_ids)
+    changed, missing = [], []
+    for user_id, actual in counts.items():
+        if user_id not in stats:
+            missing.append(UserStats(user_id=user_id, **actual))
+            continue
+        row = stats[user_id]
+        if any(getattr(row, field) != value
+               for field, value in actual.items()):
+            for field, value in actual.items():
+                setattr(row, field, value)
+            changed.append(row)
+    UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+    UserStats.objects.bulk_update(changed, list(USER_COUNTERS))
+    return len(changed) + len(missing)
+
+
+def reconcile_posts(post_ids, using=None):
+    """Исправляет счётчики комментариев постов одной базы."""
+    actual = dict.fromkeys(post_ids, 0)
+    actual.update(
+        Comment.objects.using(using).filter(post_id__in=post_ids)
+        .values('post_id').annotate(total=Count('pk'))
+        .values_list('post_id', 'total')
+    )
+    posts = Post.objects.using(using)
+    changed = []
+    for post in posts.filter(pk__in=post_ids).only('comments_count'):
+        if post.comments_count != actual[post.pk]:
+            post.comments_count = actual[post.pk]
+            changed.append(post)
+    posts.bulk_update(changed, ['comments_count'])
+    return len(changed)
@@ -1,5 +1,9 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 
+from . import uploads
 from .models import Comment, Post
 
 
@@ -18,6 +22,21 @@ class PostForm(forms.ModelForm):
             'image': 'Изображение для нового поста'
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if not isinstance(image, UploadedFile):
+            return image
+        uploads.check_limits(image)
+        try:
+            return uploads.process(image)
+        except (OSError, Image.DecompressionBombError) as error:
+            # `verify()` не читает растр JPEG, и обрезанный файл проходит
+            # проверку поля, но падает при декодировании.
+            raise ValidationError(
+                self.fields['image'].error_messages['invalid_image'],
+                code='invalid_image'
+            ) from error
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
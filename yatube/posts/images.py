@@ -0,0 +1,163 @@
+"""Счётчики ссылок на файлы изображений и их дедупликация.
+
+Один файл может принадлежать нескольким постам, поэтому он удаляется
+вместе с миниатюрами только тогда, когда на него не ссылается ни один
+пост. Счётчик `StoredImage.references` меняется атомарно через `F()`;
+если записи ещё нет (файл загружен до появления счётчиков), она
+создаётся с реальным количеством ссылок.
+
+Проверка счётчика и удаление файла идут в одной транзакции под
+блокировкой строки `StoredImage`, которую берёт и `acquire`: пока
+строка есть, есть и файл. Загрузка той же картинки могла увидеть файл
+до удаления, поэтому `acquire` получает её содержимое и, не найдя
+строки, записывает файл заново.
+"""
+import logging
+import os
+from collections import defaultdict
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from sorl import thumbnail
+
+from . import sharding, thumbnails
+from . import storage as hashing
+from .models import Post, StoredImage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIRECTORY = 'posts'
+
+
+def image_storage():
+    return Post._meta.get_field('image').storage
+
+
+def file_size(name):
+    try:
+        return image_storage().size(name)
+    except (OSError, SuspiciousFileOperation):
+        return 0
+
+
+def acquire(name, content=None):
+    updated = StoredImage.objects.filter(name=name).update(
+        references=F('references') + 1
+    )
+    if not updated:
+        if content is not None and not image_storage().exists(name):
+            # Файл удалили вместе с записью между проверкой в хранилище
+            # и этой ссылкой.
+            content.seek(0)
+            image_storage().save(
+                os.path.join(IMAGE_DIRECTORY, os.path.basename(name)),
+                content
+            )
+        StoredImage.objects.get_or_create(name=name, defaults={
+            'references': sharding.count_posts(image=name),
+            'size': file_size(name),
+        })
+
+
+def release(name):
+    updated = StoredImage.objects.filter(
+        name=name, references__gt=0
+    ).update(references=F('references') - 1)
+    if not updated:
+        StoredImage.objects.get_or_create(name=name, defaults={
+            'references': sharding.count_posts(image=name),
+            'size': file_size(name),
+        })
+    transaction.on_commit(lambda: delete_if_unused(name))
+
+
+def delete_file(name):
+    """Удаляет файл, его миниатюры и их записи в хранилище sorl."""
+    try:
+        thumbnail.delete(thumbnails.source_file(name))
+    except (OSError, SuspiciousFileOperation):
+        logger.warning('Не удалось удалить файл %s', name)
+
+
+def delete_if_unused(name):
+    with transaction.atomic():
+        # DELETE блокирует строку так же, как UPDATE в `acquire`, и
+        # блокировка держится, пока удаляется файл.
+        deleted, _ = StoredImage.objects.filter(
+            name=name, references=0
+        ).delete()
+        if not deleted:
+            return False
+        if sharding.posts_exist(image=name):
+            transaction.set_rollback(True)
+            return False
+        delete_file(name)
+    return True
+
+
+def image_files(directory=IMAGE_DIRECTORY):
+    storage = image_storage()
+    if not storage.exists(directory):
+        return
+    subdirectories, files = storage.listdir(directory)
+    for filename in files:
+        yield os.path.join(directory, filename)
+    for subdirectory in subdirectories:
+        yield from image_files(os.path.join(directory, subdirectory))
+
+
+def duplicates():
+    """Группы одинаковых файлов: адресное имя и имена копий."""
+    storage = image_storage()
+    groups = defaultdict(list)
+    for name in image_files():
+        with storage.open(name) as content:
+            groups[hashing.content_hash(content)].append(name)
+    for digest, names in groups.items():
+        hashed = [name for name in names if hashing.is_hashed(name)]
+        if len(names) > 1:
+            target = hashed[0] if hashed else hashing.hashed_name(
+                IMAGE_DIRECTORY, digest, os.path.splitext(names[0])[1]
+            )
+            yield target, [name for name in names if name != target]
+
+
+def merge(target, names):
+    """Переводит посты с копий на `target` и удаляет копии.
+
+    Возвращает переведённые посты, готовность миниатюр `target` и
+    количество освобождённых байт.
+    """
+    storage = image_storage()
+    reclaimed = sum(file_size(name) for name in names)
+    if not storage.exists(target):
+        with storage.open(names[0]) as content:
+            # Адресное хранилище само выберет имя по содержимому.
+            target = storage.save(
+                os.path.join(IMAGE_DIRECTORY, os.path.basename(target)),
+                content
+            )
+        reclaimed -= file_size(target)
+    with transaction.atomic():
+        thumbnail_ready = sharding.posts_exist(
+            image=target, thumbnail_ready=True
+        )
+        moved = []
+        for alias in sharding.aliases():
+            posts = Post.objects.using(alias)
+            ids = list(posts.filter(image__in=names).values_list(
+                'pk', flat=True
+            ))
+            posts.filter(pk__in=ids).update(
+                image=target, thumbnail_ready=thumbnail_ready
+            )
+            moved += ids
+        StoredImage.objects.filter(name__in=names).delete()
+        StoredImage.objects.update_or_create(name=target, defaults={
+            'references': sharding.count_posts(image=target),
+            'size': file_size(target),
+        })
+    for name in names:
+        delete_file(name)
+    return moved, thumbnail_ready, reclaimed
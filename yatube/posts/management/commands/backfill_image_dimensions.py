@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import caching, sharding, uploads
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет image_width и image_height постов, сохранённых до '
+        'появления этих полей. Заголовки файлов читаются в пуле потоков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Количество потоков чтения файлов')
+
+    def batches(self, queryset, size):
+        last_pk = 0
+        while True:
+            posts = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk')
+                .only('pk', 'image')[:size]
+            )
+            if not posts:
+                return
+            yield posts
+            last_pk = posts[-1].pk
+
+    def handle(self, *args, **options):
+        filled = missing = 0
+        with ThreadPoolExecutor(options['workers']) as executor:
+            for alias in sharding.aliases():
+                posts = Post.objects.using(alias).exclude(image='').filter(
+                    image_width__isnull=True
+                )
+                for batch in self.batches(posts, options['batch_size']):
+                    sizes = executor.map(
+                        lambda post: uploads.dimensions(post.image), batch
+                    )
+                    changed = []
+                    for post, (width, height) in zip(batch, sizes):
+                        if width is None:
+                            missing += 1
+                            continue
+                        post.image_width, post.image_height = width, height
+                        changed.append(post)
+                    Post.objects.using(alias).bulk_update(
+                        changed, ['image_width', 'image_height']
+                    )
+                    filled += len(changed)
+        if filled:
+            # Карточки и страницы перерисуются уже с размерами картинок.
+            caching.bump('index', 'groups')
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнены размеры: {filled}, файлы не прочитаны: {missing}'
+        ))
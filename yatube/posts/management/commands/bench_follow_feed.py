@@ -0,0 +1,108 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+from posts.models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает чтение первой страницы ленты подписок через JOIN, '
+        'гибридную ленту (материализованная лента + k-way merge потоков '
+        'популярных авторов) и чистую pull-модель. Данные создаются '
+        'во временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int,
+                            default=[10, 1000, 10000],
+                            help='Количество авторов в подписках')
+        parser.add_argument('--posts-per-author', type=int, default=3)
+        parser.add_argument('--pulled', type=int, default=10,
+                            help='Сколько авторов читаются pull-моделью '
+                                 'в гибридной ленте')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def measure(self, func, repeat):
+        func()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    def populate(self, size, posts_per_author):
+        reader = User.objects.create_user(username='bench-reader')
+        User.objects.bulk_create(
+            User(username=f'bench-author-{number}') for number in range(size)
+        )
+        authors = list(User.objects.filter(
+            username__startswith='bench-author-'
+        ).values_list('pk', flat=True))
+        Follow.objects.bulk_create(
+            Follow(user=reader, author_id=author_id) for author_id in authors
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author_id=author_id)
+            for number in range(posts_per_author)
+            for author_id in authors
+        )
+        timeline.rebuild(reader.pk)
+        return reader, authors
+
+    def run_size(self, size, options):
+        reader, authors = self.populate(size, options['posts_per_author'])
+        per_page = settings.POSTS_LIM
+
+        def join():
+            posts = Post.objects.filter(
+                author__following__user=reader
+            ).select_related('author', 'group').order_by('-pub_date', '-pk')
+            return list(posts[:per_page])
+
+        pulled_ids = authors[:options['pulled']]
+        TimelineEntry.objects.filter(
+            user=reader, author_id__in=pulled_ids
+        ).delete()
+        hybrid = timeline.HybridFeedPaginator(
+            TimelineEntry.objects.filter(user=reader), per_page,
+            pulled_ids=pulled_ids
+        )
+        pull = timeline.HybridFeedPaginator(
+            TimelineEntry.objects.none(), per_page, pulled_ids=authors
+        )
+
+        def merged(paginator):
+            return lambda: timeline.load_posts(
+                paginator.fetch(None, False, per_page)
+            )
+
+        reads = (join, merged(hybrid), merged(pull))
+        return [self.measure(read, options['repeat']) for read in reads]
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"авторов":>10} {"JOIN, мс":>12} {"гибрид, мс":>12} '
+            f'{"pull, мс":>12}'
+        )
+        for size in options['sizes']:
+            cache.clear()
+            try:
+                with transaction.atomic():
+                    results = self.run_size(size, options)
+                    raise Rollback
+            except Rollback:
+                pass
+            self.stdout.write(
+                f'{size:>10} ' + ' '.join(f'{ms:>12.2f}' for ms in results)
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts import caching, images, thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Объединяет одинаковые файлы в MEDIA_ROOT/posts: посты переводятся '
+        'на файл с именем по содержимому, копии и их миниатюры удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать копии, ничего не менять')
+
+    def handle(self, *args, **options):
+        merged = reclaimed = 0
+        moved_posts = []
+        for target, names in images.duplicates():
+            merged += len(names)
+            if options['dry_run']:
+                reclaimed += sum(images.file_size(name) for name in names)
+                if not images.image_storage().exists(target):
+                    reclaimed -= images.file_size(names[0])
+                continue
+            moved, thumbnail_ready, freed = images.merge(target, names)
+            reclaimed += freed
+            moved_posts.extend(moved)
+            if not thumbnail_ready:
+                thumbnails.enqueue_many(moved)
+        if moved_posts:
+            caching.bump('index', 'groups')
+        self.stdout.write(self.style.SUCCESS(
+            f'Объединено копий: {merged}, освобождено: '
+            f'{filesizeformat(reclaimed)} ({reclaimed} байт)'
+        ))
@@ -0,0 +1,72 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import sharding, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт миниатюры изображений постов из очереди в пуле процессов. '
+        'С --all досоздаёт варианты для всех существующих изображений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Количество процессов пула')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--missing', action='store_true',
+                            help='Поставить в очередь все посты без '
+                                 'готовых миниатюр')
+        parser.add_argument('--all', action='store_true',
+                            help='Поставить в очередь все посты с '
+                                 'изображениями, чтобы создать варианты, '
+                                 'добавленные в POST_THUMBNAILS')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Вернуть в очередь задачи, исчерпавшие '
+                                 'THUMBNAIL_MAX_ATTEMPTS')
+        parser.add_argument('--poll', type=float, default=0,
+                            help='Работать постоянно, проверяя очередь '
+                                 'с этим интервалом в секундах')
+
+    def enqueue(self, options):
+        for alias in sharding.aliases():
+            posts = Post.objects.using(alias).exclude(image='')
+            if not options['all']:
+                posts = posts.filter(thumbnail_ready=False)
+            thumbnails.enqueue_many(
+                posts.values_list('pk', flat=True).iterator()
+            )
+
+    def handle(self, *args, **options):
+        thumbnails.check_sorl_version()
+        done = failed = 0
+        if options['retry_failed']:
+            thumbnails.retry(thumbnails.failed())
+        # Процессы пула создаются fork'ом до первого запроса к базе, чтобы
+        # не унаследовать открытые соединения.
+        connections.close_all()
+        with ProcessPoolExecutor(options['workers']) as executor:
+            executor.submit(os.getpid).result()
+            if options['missing'] or options['all']:
+                self.enqueue(options)
+            while True:
+                tasks = thumbnails.pending(options['batch_size'])
+                if tasks:
+                    batch_done, batch_failed = thumbnails.process(
+                        tasks, executor
+                    )
+                    done += batch_done
+                    failed += batch_failed
+                    if batch_done or not options['poll']:
+                        continue
+                if not options['poll']:
+                    break
+                time.sleep(options['poll'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово миниатюр: {done}, ошибок: {failed}'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import caching
+
+CACHED_VIEWS = ('index', 'group_posts', 'profile', 'post_detail')
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания, промахи и устаревшие ответы кеша страниц'
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"страница":<12} {"hit":>8} {"miss":>8} {"stale":>8}'
+        )
+        for view_name in CACHED_VIEWS:
+            counts = caching.stats(view_name)
+            self.stdout.write(
+                f'{view_name:<12} ' + ' '.join(
+                    f'{counts[outcome]:>8}' for outcome in caching.OUTCOMES
+                )
+            )
@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from posts import search, sharding
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты и их комментарии из основной базы и шардов на '
+        'шарды авторов из POST_SHARDS. Запускается при остановленной '
+        'записи; прерванный перенос продолжается повторным запуском.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать посты для переноса')
+
+    def batches(self, queryset, size):
+        last_pk = 0
+        while True:
+            posts = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk')[:size]
+            )
+            if not posts:
+                return
+            yield posts
+            last_pk = posts[-1].pk
+
+    def delete(self, alias, model, column, ids):
+        # Без сигналов: пост не удалён, а переехал, и его файлы, счётчики
+        # и очередь миниатюр трогать нельзя.
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {model._meta.db_table} '
+                f'WHERE {column} IN ({placeholders})', ids
+            )
+
+    def move(self, source, target, posts):
+        ids = [post.pk for post in posts]
+        comments = list(
+            Comment.objects.using(source).filter(post_id__in=ids)
+        )
+        post_dates = [(post.pub_date, post.updated_at) for post in posts]
+        comment_dates = [comment.created for comment in comments]
+        # Сначала копия, потом удаление: после сбоя пост окажется на
+        # обоих шардах, а не потеряется, и ленты покажут его один раз.
+        with transaction.atomic(using=target):
+            Post.objects.using(target).bulk_create(
+                posts, ignore_conflicts=True
+            )
+            Comment.objects.using(target).bulk_create(
+                comments, ignore_conflicts=True
+            )
+            # `bulk_create` проставляет `auto_now` и `auto_now_add`
+            # текущим временем; копия должна сохранить даты оригинала.
+            for post, (pub_date, updated_at) in zip(posts, post_dates):
+                post.pub_date, post.updated_at = pub_date, updated_at
+            for comment, created in zip(comments, comment_dates):
+                comment.created = created
+            Post.objects.using(target).bulk_update(
+                posts, ['pub_date', 'updated_at']
+            )
+            Comment.objects.using(target).bulk_update(comments, ['created'])
+            for post in posts:
+                search.index(post)
+        with transaction.atomic(using=source):
+            self.delete(source, Comment, 'post_id', ids)
+            self.delete(source, Post, 'id', ids)
+            for post_id in ids:
+                search.remove(post_id, using=source)
+        return len(comments)
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('POST_SHARDS пуст: переносить некуда')
+        if not options['dry_run']:
+            sharding.reset_sequences()
+        moved_posts = moved_comments = 0
+        sources = list(dict.fromkeys([DEFAULT_DB_ALIAS, *sharding.shards()]))
+        for source in sources:
+            for batch in self.batches(Post.objects.using(source),
+                                      options['batch_size']):
+                targets = {}
+                for post in batch:
+                    target = sharding.shard_for(post.author_id)
+                    if target != source:
+                        targets.setdefault(target, []).append(post)
+                for target, posts in targets.items():
+                    moved_posts += len(posts)
+                    if not options['dry_run']:
+                        moved_comments += self.move(source, target, posts)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено постов: {moved_posts}, '
+            f'комментариев: {moved_comments}'
+        ))
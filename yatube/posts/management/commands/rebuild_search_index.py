@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from posts import search, sharding
+
+
+class Command(BaseCommand):
+    help = 'Заново строит полнотекстовый индекс постов FTS5'
+
+    def handle(self, *args, **options):
+        indexed = 0
+        for alias in sharding.shards() or [DEFAULT_DB_ALIAS]:
+            with transaction.atomic(using=alias):
+                indexed += search.rebuild(using=alias)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {indexed}'
+        ))
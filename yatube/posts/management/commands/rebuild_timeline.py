@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи, чьи ленты нужно пересобрать (по умолчанию все)'
+        )
+
+    def handle(self, *args, **options):
+        timeline.refresh_pulled_authors()
+        follows = Follow.objects.all()
+        if options['usernames']:
+            follows = follows.filter(user__username__in=options['usernames'])
+        else:
+            TimelineEntry.objects.exclude(
+                user_id__in=follows.values('user_id')
+            ).delete()
+        user_ids = list(
+            follows.values_list('user_id', flat=True).distinct()
+        )
+        for user_id in user_ids:
+            timeline.rebuild(user_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {len(user_ids)}'
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters, sharding
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с реальными данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def batches(self, queryset, size):
+        last_pk = 0
+        while True:
+            pks = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:size]
+            )
+            if not pks:
+                return
+            yield pks
+            last_pk = pks[-1]
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        fixed_users = sum(
+            counters.reconcile_users(pks)
+            for pks in self.batches(User.objects.all(), size)
+        )
+        fixed_posts = sum(
+            counters.reconcile_posts(pks, using=alias)
+            for alias in sharding.aliases()
+            for pks in self.batches(Post.objects.using(alias), size)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков пользователей: {fixed_users}, '
+            f'постов: {fixed_posts}'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает популярных авторов ленты подписок. Запускается по '
+        'расписанию, например раз в час.'
+    )
+
+    def handle(self, *args, **options):
+        pulled = timeline.refresh_pulled_authors()
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярных авторов: {len(pulled)}'
+        ))
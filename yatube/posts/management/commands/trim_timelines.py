@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрезает ленты подписок до TIMELINE_LIMIT записей. Запускается '
+        'по расписанию, например раз в час.'
+    )
+
+    def handle(self, *args, **options):
+        user_ids = timeline.overflowing_users()
+        timeline.trim(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обрезано лент: {len(user_ids)}'
+        ))
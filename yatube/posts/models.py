@@ -1,9 +1,46 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
+class RoutedQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # Без явного using() базу выбирает роутер по самому объекту:
+        # так пост попадает на шард своего автора.
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class ShardedModel(models.Model):
+    """Модель, записи которой могут лежать на шардах.
+
+    На шардах `id` общий для всех баз и выдаётся до сохранения. С ним
+    сразу выполняется INSERT: иначе Django, увидев заданный `pk`, сначала
+    попробовал бы UPDATE.
+    """
+
+    objects = RoutedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if self.pk is None:
+            # sharding импортирует модели.
+            from . import sharding
+            if sharding.enabled():
+                self.pk = sharding.allocate_id(type(self))
+                force_insert = True
+        super().save(force_insert, force_update, using, update_fields)
+
+
 class Group(models.Model):
     title = models.CharField(verbose_name='Название', max_length=200,
                              help_text='Назовите группу')
@@ -17,7 +54,7 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class Post(ShardedModel):
     text = models.TextField(verbose_name='Текст поста',
                             help_text='Введите текст поста')
     pub_date = models.DateTimeField(
@@ -25,6 +62,10 @@ class Post(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -43,19 +84,48 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0,
+        editable=False
+    )
+    thumbnail_ready = models.BooleanField(
+        verbose_name='Миниатюра готова',
+        default=False,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Comment(models.Model):
+class Comment(ShardedModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -81,6 +151,10 @@ class Comment(models.Model):
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -100,3 +174,135 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_follow')
         ]
+        indexes = [
+            # Подписчики автора: `unique_follow` начинается с `user`.
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date', '-post_id')
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Количество постов', default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков', default=0, db_index=True
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Количество подписок', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class ThumbnailTask(models.Model):
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='thumbnail_task',
+        verbose_name='Пост'
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата постановки в очередь',
+        auto_now=True
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Неудачных попыток', default=0
+    )
+    retry_at = models.DateTimeField(
+        verbose_name='Следующая попытка',
+        null=True,
+        blank=True
+    )
+    last_error = models.TextField(
+        verbose_name='Последняя ошибка',
+        blank=True
+    )
+
+    class Meta:
+        ordering = ('created',)
+        verbose_name = 'Задача генерации миниатюр'
+        verbose_name_plural = 'Очередь генерации миниатюр'
+
+    def __str__(self):
+        return str(self.post_id)
+
+
+class StoredImage(models.Model):
+    name = models.CharField(
+        verbose_name='Имя файла', max_length=100, unique=True
+    )
+    size = models.BigIntegerField(verbose_name='Размер в байтах', default=0)
+    references = models.PositiveIntegerField(
+        verbose_name='Количество ссылок', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+
+    def __str__(self):
+        return self.name
+
+
+class IdSequence(models.Model):
+    name = models.CharField(
+        verbose_name='Модель', max_length=100, unique=True
+    )
+    value = models.BigIntegerField(verbose_name='Последний id', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчик id'
+        verbose_name_plural = 'Счётчики id'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,312 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+COUNT_KEY = 'feed-count:v2:{}'
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def _encode_value(value):
+    # Полная точность нужна, иначе посты с близким pub_date потеряются.
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} нельзя записать в курсор')
+
+
+class CursorPage(Page):
+    """Страница ленты, полученная по курсору.
+
+    У таких страниц нет номера (`number is None`), а наличие соседних
+    страниц известно без `COUNT(*)`.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Page by cursor>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу `(pub_date, id)`.
+
+    Номерные страницы (`?page=`) работают как у обычного `Paginator`,
+    а переход по курсору (`?cursor=`) выполняется одним запросом
+    `WHERE (pub_date, id) < (...) ORDER BY pub_date DESC, id DESC LIMIT n`
+    по индексу `pub_date`, без `COUNT(*)` и `OFFSET`.
+
+    С `count_key` число записей берётся из кеша и живёт в нём не дольше
+    `FEED_COUNT_TIMEOUT` секунд. Ключ должен меняться при каждой записи
+    в ленту (`caching.count_key`), тогда посчитанное число остаётся
+    точным и в следующих запросах. Если при этом лента не
+    отфильтрована и в ней больше `FEED_COUNT_ESTIMATE_ABOVE` записей,
+    вместо `COUNT(*)` берётся оценка по наибольшему `id`, а `approximate`
+    становится True.
+    """
+
+    ordering = ('-pub_date', '-pk')
+    ELLIPSIS = '…'
+    approximate = False
+    # Число записей посчитано `COUNT(*)` по актуальной ленте.
+    exact = False
+
+    def __init__(self, object_list, per_page, ordering=None, transform=None,
+                 count=None, count_key=None, **kwargs):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        self.transform = transform
+        self.count_key = count_key
+        object_list = object_list.order_by(*self.ordering)
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            # Известное заранее число записей избавляет от `COUNT(*)`,
+            # но может разойтись с лентой.
+            self.count = count
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            self.exact = True
+            return self.exact_count()
+        key = COUNT_KEY.format(self.count_key)
+        cached = cache.get(key)
+        if cached is None:
+            estimate = self.estimated_count()
+            if estimate is not None:
+                cached = (estimate, False)
+            else:
+                cached = (self.exact_count(), True)
+            cache.set(key, cached, settings.FEED_COUNT_TIMEOUT)
+        count, self.exact = cached
+        self.approximate = not self.exact
+        return count
+
+    def exact_count(self):
+        return self.object_list.count()
+
+    def estimated_count(self):
+        """Оценка сверху для большой неотфильтрованной ленты или None.
+
+        `MAX(id)` читается из конца индекса первичного ключа, но
+        учитывает и удалённые посты.
+        """
+        if self.object_list.query.has_filters():
+            return None
+        estimate = self.max_id()
+        if estimate > settings.FEED_COUNT_ESTIMATE_ABOVE:
+            return estimate
+        return None
+
+    def max_id(self):
+        return self.object_list.aggregate(top=Max('pk'))['top'] or 0
+
+    def page(self, number):
+        """Номерная страница; страницы второй половины читаются с конца.
+
+        `OFFSET` заставляет базу пройти все пропущенные записи, поэтому
+        страница из второй половины ленты выбирается в обратном порядке
+        с отступом от конца и переворачивается. Последняя страница стоит
+        столько же, сколько первая. Так читается только при точном числе
+        записей: с оценкой или с числом, переданным в `count`, страница с
+        конца повторила бы или потеряла посты. Иначе отступ считается от
+        начала.
+        """
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            # Неточное число не должно обрезать последнюю страницу.
+            top = self.count if self.exact else top + self.orphans
+        if self.exact and bottom * 2 >= self.count:
+            items = self.tail(self.count - top, self.count - bottom)
+        else:
+            items = self.head(bottom, top)
+        return self._get_page(items, number, self)
+
+    def head(self, start, stop):
+        """Записи `[start:stop]` от начала ленты."""
+        return list(self.object_list[start:stop])
+
+    def tail(self, start, stop):
+        """Записи `[start:stop]` от конца ленты, в прямом порядке."""
+        items = list(
+            self.object_list.order_by(*self._reversed_ordering())[start:stop]
+        )
+        items.reverse()
+        return items
+
+    def _get_page(self, *args, **kwargs):
+        return self._finish_page(Page(*args, **kwargs))
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        """Номера страниц вокруг `number` и по краям, пропуски — `ELLIPSIS`.
+
+        Повторяет `Paginator.get_elided_page_range` из Django 3.2: у ленты
+        в сотни тысяч страниц навигация остаётся в пределах десятка ссылок.
+        """
+        number = self.validate_number(number)
+        if (not self.approximate
+                and self.num_pages <= (on_each_side + on_ends) * 2):
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            if not self.approximate:
+                # Последние номера по оценке могут оказаться пустыми.
+                yield from range(self.num_pages - on_ends + 1,
+                                 self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+    def _finish_page(self, page):
+        """Запоминает ключи крайних записей и применяет `transform`.
+
+        `transform` позволяет листать одну модель (например, записи
+        ленты подписок), а в шаблон отдавать связанные с ней посты.
+        """
+        items = list(page.object_list)
+        page.first_key = self.cursor_key(items[0]) if items else None
+        page.last_key = self.cursor_key(items[-1]) if items else None
+        page.object_list = self.transform(items) if self.transform else items
+        return page
+
+    @property
+    def key_fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def cursor_key(self, obj):
+        return [getattr(obj, field) for field in self.key_fields]
+
+    def make_cursor(self, values, reverse=False):
+        payload = json.dumps(
+            {'v': values, 'r': int(reverse)}, default=_encode_value
+        )
+        token = base64.urlsafe_b64encode(payload.encode())
+        return token.decode().rstrip('=')
+
+    def next_cursor(self, page):
+        if not page.has_next() or page.last_key is None:
+            return None
+        return self.make_cursor(page.last_key)
+
+    def previous_cursor(self, page):
+        if not page.has_previous() or page.first_key is None:
+            return None
+        return self.make_cursor(page.first_key, reverse=True)
+
+    def key_value(self, name, value):
+        opts = self.object_list.model._meta
+        field = opts.pk if name == 'pk' else opts.get_field(name)
+        return field.to_python(value)
+
+    def parse_cursor(self, cursor):
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            payload = json.loads(
+                base64.urlsafe_b64decode(cursor + padding).decode()
+            )
+            raw_values, reverse = payload['v'], bool(payload['r'])
+            if len(raw_values) != len(self.ordering):
+                raise ValueError
+            values = [
+                self.key_value(name, value)
+                for name, value in zip(self.key_fields, raw_values)
+            ]
+        except (binascii.Error, ValidationError, ValueError, KeyError,
+                TypeError) as error:
+            raise InvalidCursor('Некорректный курсор') from error
+        return values, reverse
+
+    def _keyset_filter(self, values, reverse):
+        lookups = [
+            'lt' if field.startswith('-') != reverse else 'gt'
+            for field in self.ordering
+        ]
+        condition = Q()
+        for index, (name, lookup) in enumerate(zip(self.key_fields,
+                                                   lookups)):
+            step = Q(**{f'{name}__{lookup}': values[index]})
+            for prev_name, prev_value in zip(self.key_fields[:index],
+                                             values[:index]):
+                step &= Q(**{prev_name: prev_value})
+            condition |= step
+        # Ограничение по первому полю позволяет SQLite сделать range scan.
+        first = Q(**{f'{self.key_fields[0]}__{lookups[0]}e': values[0]})
+        return first & condition
+
+    def _reversed_ordering(self):
+        return [
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        ]
+
+    def fetch(self, values, reverse, limit):
+        """Не больше `limit` записей за ключом `values`.
+
+        При `reverse` записи идут до ключа, в обратном порядке.
+        """
+        queryset = self.object_list.filter(
+            self._keyset_filter(values, reverse)
+        )
+        if reverse:
+            queryset = queryset.order_by(*self._reversed_ordering())
+        return list(queryset[:limit])
+
+    def cursor_page(self, cursor):
+        values, reverse = self.parse_cursor(cursor)
+        items = self.fetch(values, reverse, self.per_page + 1)
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if not reverse:
+            return self._finish_page(CursorPage(
+                items, self, has_next=has_more, has_previous=True
+            ))
+        if not has_more:
+            # До начала ленты осталось меньше страницы: отдаём первую.
+            return self.get_page(1)
+        items.reverse()
+        return self._finish_page(CursorPage(
+            items, self, has_next=True, has_previous=True
+        ))
+
+    def get_cursor_page(self, cursor):
+        try:
+            return self.cursor_page(cursor)
+        except InvalidCursor:
+            return self.get_page(1)
+
+
+def paginate(request, object_list, paginator_class=CursorPaginator,
+             **kwargs):
+    """Страница ленты по `?cursor=`, либо по старому `?page=`."""
+    paginator = paginator_class(object_list, settings.POSTS_LIM, **kwargs)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        return paginator.get_cursor_page(cursor)
+    return paginator.get_page(request.GET.get('page'))
@@ -0,0 +1,169 @@
+"""Полнотекстовый поиск по постам на индексе SQLite FTS5.
+
+Виртуальная таблица `posts_post_fts` хранит текст постов под их `id`
+(rowid) и обновляется сигналами сохранения и удаления поста. Запрос
+пользователя разбивается на слова, каждое слово экранируется, а
+последнее ищется как префикс. Результаты упорядочены по релевантности
+BM25 (`rank`) и листаются курсором по `(rank, id)`.
+
+В режиме шардов у каждого шарда свой индекс его постов, а результаты
+сливает `ShardedSearchPaginator`; BM25 при этом считается по
+статистике отдельного шарда.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginators import CursorPaginator
+from .sharding import ShardedPaginator
+
+TABLE = 'posts_post_fts'
+MAX_TERMS = 10
+SNIPPET_TOKENS = 24
+# Управляющие символы не встречаются в тексте постов и переживают
+# экранирование HTML, поэтому подсветка добавляется уже после него.
+MARK_START, MARK_END = '\x02', '\x03'
+TERM = re.compile(r'\w+')
+
+
+def fts_query(text):
+    """Безопасный запрос FTS5 из произвольной строки; None, если слов нет."""
+    terms = TERM.findall(text)[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def matching(text):
+    """Посты, подходящие под запрос, с релевантностью в `rank`."""
+    query = fts_query(text)
+    if query is None:
+        return Post.objects.none()
+    return Post.objects.extra(
+        tables=[TABLE],
+        where=[f'{TABLE}.rowid = posts_post.id', f'{TABLE} MATCH %s'],
+        params=[query]
+    ).annotate(rank=RawSQL(f'{TABLE}.rank', ()))
+
+
+def match_count(text, using=DEFAULT_DB_ALIAS):
+    """Число подходящих постов прямо по индексу, без соединения с постами."""
+    query = fts_query(text)
+    if query is None:
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {TABLE} WHERE {TABLE} MATCH %s', [query]
+        )
+        return cursor.fetchone()[0]
+
+
+def snippets(text, post_ids, using=DEFAULT_DB_ALIAS):
+    """Фрагменты текста с найденными словами для постов `post_ids`.
+
+    `snippet()` нельзя вычислить в подзапросе `COUNT(*)`, поэтому
+    фрагменты выбираются отдельно и только для постов страницы.
+    """
+    query = fts_query(text)
+    if query is None or not post_ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, snippet({TABLE}, 0, %s, %s, %s, %s) '
+            f'FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'AND rowid IN ({placeholders})',
+            [MARK_START, MARK_END, '…', SNIPPET_TOKENS, query, *post_ids]
+        )
+        return dict(cursor.fetchall())
+
+
+def match_ids(text):
+    """Подзапрос `id` подходящих постов — для фильтрации чужих запросов."""
+    query = fts_query(text)
+    if query is None:
+        return None
+    return RawSQL(f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s',
+                  (query,))
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def index(post):
+    with connections[post._state.db].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {TABLE}(rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text]
+        )
+
+
+def remove(post_id, using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild(using=DEFAULT_DB_ALIAS):
+    """Переиндексирует все посты базы одним `INSERT ... SELECT`."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(
+            f'INSERT INTO {TABLE}(rowid, text) '
+            f'SELECT id, text FROM {Post._meta.db_table}'
+        )
+        indexed = cursor.rowcount
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+class SearchPaginator(CursorPaginator):
+    """Результаты поиска по убыванию релевантности.
+
+    BM25 в FTS5 отрицателен: чем меньше `rank`, тем выше пост.
+    """
+
+    ordering = ('rank', '-pk')
+
+    def __init__(self, object_list, per_page, query='', **kwargs):
+        self.query = query
+        super().__init__(object_list, per_page, transform=self.add_snippets,
+                         **kwargs)
+
+    def exact_count(self):
+        return match_count(self.query)
+
+    def add_snippets(self, posts):
+        found = {}
+        for alias in {post._state.db for post in posts}:
+            found.update(snippets(
+                self.query,
+                [post.pk for post in posts if post._state.db == alias],
+                using=alias
+            ))
+        for post in posts:
+            post.snippet = found.get(post.pk, '')
+        return posts
+
+    def key_value(self, name, value):
+        if name == 'rank':
+            return float(value)
+        return super().key_value(name, value)
+
+
+class ShardedSearchPaginator(ShardedPaginator, SearchPaginator):
+    """Результаты поиска из всех шардов, слитые по `(rank, id)`."""
+
+    def exact_count(self):
+        return sum(
+            match_count(self.query, using=alias) for alias in self.aliases
+        )
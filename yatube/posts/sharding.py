@@ -0,0 +1,332 @@
+"""Шардирование постов и комментариев по автору.
+
+Когда `POST_SHARDS` не пуст, пост хранится на шарде, выбранном по
+`id` автора, а комментарии — на шарде своего поста. Шард выбирается
+rendezvous-хешированием: при добавлении шарда переезжает только
+примерно `1/N` авторов. Пользователи, группы, подписки и служебные
+таблицы остаются в основной базе, поэтому соединения с ними заменяются
+отдельными запросами (`prefetch_related`), а внешние ключи SQLite на
+этих базах выключаются.
+
+`ShardRouter` направляет запросы по подсказке `instance`: сам пост,
+его автор или комментарий. Ленты из нескольких шардов (`index`,
+группы, подписки, поиск) собирает `ShardedPaginator`: каждый шард
+отдаёт свою страницу по курсору, страницы сливаются k-way merge.
+`id` постов и комментариев выдаёт счётчик `IdSequence` основной базы,
+чтобы они были уникальны во всех шардах.
+"""
+import functools
+import hashlib
+import heapq
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Max, prefetch_related_objects
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from .models import Comment, IdSequence, Post, User
+from .paginators import CursorPaginator
+
+SHARDED_MODELS = (Post, Comment)
+
+
+def shards():
+    return list(getattr(settings, 'POST_SHARDS', ()))
+
+
+def enabled():
+    return bool(shards())
+
+
+def shard_for(author_id):
+    """Шард автора: алиас с наибольшим хешем от `alias:author_id`."""
+    return max(shards(), key=lambda alias: hashlib.md5(
+        f'{alias}:{author_id}'.encode()
+    ).digest())
+
+
+def aliases(model=Post):
+    """Базы с записями модели; None — выбор обычных роутеров."""
+    if enabled() and model in SHARDED_MODELS:
+        return shards()
+    return [None]
+
+
+def author_posts(author_id):
+    if not enabled():
+        return Post.objects.all()
+    return Post.objects.using(shard_for(author_id))
+
+
+def delete_user_records(user_id):
+    """Удаляет с шардов посты и комментарии пользователя.
+
+    Каскад при удалении пользователя работает только в основной базе.
+    Удаление идёт через ORM, чтобы сработали сигналы постов.
+    """
+    for alias in shards():
+        Comment.objects.using(alias).filter(author_id=user_id).delete()
+        Post.objects.using(alias).filter(author_id=user_id).delete()
+
+
+def count_posts(**filters):
+    return sum(
+        Post.objects.using(alias).filter(**filters).count()
+        for alias in aliases()
+    )
+
+
+def posts_exist(**filters):
+    return any(
+        Post.objects.using(alias).filter(**filters).exists()
+        for alias in aliases()
+    )
+
+
+def in_bulk(post_ids, queryset=None):
+    """Посты по `id` из всех шардов: `{id: пост}`."""
+    queryset = Post.objects.all() if queryset is None else queryset
+    found = {}
+    for alias in aliases():
+        missing = [pk for pk in post_ids if pk not in found]
+        if not missing:
+            break
+        found.update(local(queryset.using(alias)).in_bulk(missing))
+    return found
+
+
+def get_post_or_404(post_id, queryset=None):
+    if not enabled():
+        return get_object_or_404(
+            Post if queryset is None else queryset, pk=post_id
+        )
+    post = in_bulk([post_id], queryset).get(post_id)
+    if post is None:
+        raise Http404('Пост не найден')
+    return post
+
+
+def related_paths(select_related, prefix=''):
+    """Пути `select_related` запроса в виде аргументов `prefetch_related`."""
+    for name, nested in select_related.items():
+        if nested:
+            yield from related_paths(nested, f'{prefix}{name}__')
+        else:
+            yield f'{prefix}{name}'
+
+
+def split_related(queryset):
+    """Запрос без соединений и пути связей, которые нужно подгрузить."""
+    select_related = queryset.query.select_related
+    if not isinstance(select_related, dict):
+        return queryset, []
+    return (queryset.select_related(None),
+            list(related_paths(select_related)))
+
+
+def local(queryset):
+    """Заменяет `select_related` на `prefetch_related` в режиме шардов.
+
+    Связанные пользователи и группы лежат в основной базе, и соединение
+    с ними на шарде вернуло бы пустой результат.
+    """
+    if not enabled():
+        return queryset
+    queryset, paths = split_related(queryset)
+    return queryset.prefetch_related(*paths)
+
+
+def allocate_id(model):
+    """Следующий `id` модели, общий для всех шардов."""
+    name = model._meta.label_lower
+    sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not sequences.filter(name=name).update(value=F('value') + 1):
+            sequences.get_or_create(
+                name=name, defaults={'value': max_id(model) + 1}
+            )
+        return sequences.get(name=name).value
+
+
+def max_id(model):
+    """Наибольший `id` модели в основной базе и во всех шардах."""
+    return max(
+        model.objects.using(alias).aggregate(top=Max('pk'))['top'] or 0
+        for alias in [DEFAULT_DB_ALIAS, *shards()]
+    )
+
+
+def reset_sequences():
+    """Поднимает счётчики `id` до уже занятых значений."""
+    for model in SHARDED_MODELS:
+        top = max_id(model)
+        sequence, created = IdSequence.objects.using(
+            DEFAULT_DB_ALIAS
+        ).get_or_create(name=model._meta.label_lower,
+                        defaults={'value': top})
+        if sequence.value < top:
+            IdSequence.objects.using(DEFAULT_DB_ALIAS).filter(
+                pk=sequence.pk
+            ).update(value=top)
+
+
+def configure_connection(connection):
+    """Выключает внешние ключи SQLite: ссылки ведут в другие базы."""
+    if (connection.vendor == 'sqlite' and enabled()
+            and connection.alias in [DEFAULT_DB_ALIAS, *shards()]):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+
+class ShardRouter:
+    """Направляет посты и комментарии на шард автора поста.
+
+    Без подсказки `instance` (лента группы, счётчики) возвращает None:
+    такие запросы обходят шарды явно через `using()`.
+    """
+
+    def _shard_of(self, model, instance):
+        if not enabled() or model not in SHARDED_MODELS:
+            return None
+        if isinstance(instance, SHARDED_MODELS):
+            if instance._state.db in shards():
+                return instance._state.db
+            if isinstance(instance, Post):
+                if instance.author_id:
+                    return shard_for(instance.author_id)
+                return None
+            post = Comment.post.field.get_cached_value(instance, None)
+            if post is not None:
+                return self._shard_of(Post, post)
+        elif isinstance(instance, User) and model is Post:
+            return shard_for(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard_of(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._shard_of(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if enabled():
+            return True
+        return None
+
+
+@functools.total_ordering
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class ShardedPaginator(CursorPaginator):
+    """Лента из нескольких шардов, собранная k-way merge.
+
+    Каждый шард отдаёт не больше `limit` записей за курсором, поэтому
+    страница стоит `len(aliases)` запросов по индексу и не требует
+    `OFFSET`. Связи из `select_related` подгружаются после слияния
+    только для постов страницы. Пост, который уже скопирован на новый
+    шард, но ещё не удалён со старого (`rebalance_posts`), выводится
+    один раз.
+    """
+
+    def __init__(self, object_list, per_page, author_ids=None, **kwargs):
+        self.authors = None
+        if author_ids is not None:
+            self.authors = by_shard(author_ids)
+        object_list, self.related = split_related(object_list)
+        super().__init__(object_list, per_page, **kwargs)
+
+    @property
+    def aliases(self):
+        return shards() if self.authors is None else list(self.authors)
+
+    def shard_list(self, alias):
+        queryset = self.object_list.using(alias)
+        if self.authors is not None:
+            queryset = queryset.filter(author_id__in=self.authors[alias])
+        return queryset
+
+    def exact_count(self):
+        return sum(self.shard_list(alias).count() for alias in self.aliases)
+
+    def estimated_count(self):
+        if self.authors is not None:
+            return None
+        return super().estimated_count()
+
+    def max_id(self):
+        # `id` общие для всех шардов, поэтому берётся наибольший.
+        return max(
+            self.shard_list(alias).aggregate(top=Max('pk'))['top'] or 0
+            for alias in self.aliases
+        )
+
+    def merge_key(self, obj, reverse=False):
+        return tuple(
+            value if field.startswith('-') == reverse else _Descending(value)
+            for field, value in zip(self.ordering, self.cursor_key(obj))
+        )
+
+    def fetch(self, values, reverse, limit):
+        sources = []
+        for alias in self.aliases:
+            queryset = self.shard_list(alias)
+            if values is not None:
+                queryset = queryset.filter(
+                    self._keyset_filter(values, reverse)
+                )
+            if reverse:
+                queryset = queryset.order_by(*self._reversed_ordering())
+            sources.append(list(queryset[:limit]))
+        items, seen = [], set()
+        for obj in heapq.merge(
+            *sources, key=functools.partial(self.merge_key, reverse=reverse)
+        ):
+            if obj.pk in seen:
+                continue
+            seen.add(obj.pk)
+            items.append(obj)
+            if len(items) == limit:
+                break
+        return items
+
+    def head(self, start, stop):
+        return self.fetch(None, False, stop)[start:]
+
+    def tail(self, start, stop):
+        items = self.fetch(None, True, stop)[start:]
+        items.reverse()
+        return items
+
+    def _finish_page(self, page):
+        prefetch_related_objects(list(page.object_list), *self.related)
+        return super()._finish_page(page)
+
+
+def by_shard(author_ids):
+    """Авторы, разложенные по шардам: `{алиас: [id, ...]}`."""
+    grouped = {}
+    for author_id in author_ids:
+        grouped.setdefault(shard_for(author_id), []).append(author_id)
+    return grouped
+
+
+def feed_options(author_ids=None):
+    """Параметры `paginate` для ленты постов в режиме шардов.
+
+    С `author_ids` лента читается только с шардов этих авторов.
+    """
+    if not enabled():
+        return {}
+    return {'paginator_class': ShardedPaginator, 'author_ids': author_ids}
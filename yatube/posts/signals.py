@@ -0,0 +1,158 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (caching, counters, images, search, sharding, thumbnails,
+               timeline, uploads)
+from .models import Comment, Follow, Group, Post, UserStats
+
+
+def invalidate_follow_pages(follow):
+    caching.bump(
+        f'author:{follow.author.username}',
+        f'author:{follow.user.username}'
+    )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, created=False, raw=False,
+                 update_fields=None, **kwargs):
+    # Вход обновляет только `last_login`, а его страницы не выводят.
+    if created or raw or update_fields == frozenset({'last_login'}):
+        return
+    # Имя автора выводится в лентах, группах, профиле и на странице поста.
+    caching.bump('index', 'groups', f'author:{instance.username}')
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def delete_sharded_records(sender, instance, **kwargs):
+    if sharding.enabled():
+        sharding.delete_user_records(instance.pk)
+
+
+@receiver(connection_created)
+def configure_shard_connection(sender, connection, **kwargs):
+    sharding.configure_connection(connection)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._old_image = instance._old_text = ''
+    if instance.pk:
+        (instance._old_group_id, instance._old_image,
+         instance._old_text) = sharding.author_posts(
+            instance.author_id
+        ).filter(pk=instance.pk).values_list(
+            'group_id', 'image', 'text'
+        ).first() or (None, '', '')
+    instance._image_changed = bool(instance.image) and (
+        not instance.image._committed
+        or instance.image.name != instance._old_image
+    )
+    instance._image_upload = (
+        None if instance.image._committed else instance.image.file
+    )
+    if instance._image_changed:
+        instance.thumbnail_ready = False
+        instance.image_width, instance.image_height = uploads.dimensions(
+            instance.image
+        )
+    elif not instance.image:
+        instance.image_width = instance.image_height = None
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+        if not sharding.enabled():
+            timeline.fan_out(instance)
+    if created or instance.text != getattr(instance, '_old_text', None):
+        search.index(instance)
+    old_image = getattr(instance, '_old_image', '')
+    if instance.image.name != old_image:
+        if instance.image:
+            images.acquire(instance.image.name,
+                           getattr(instance, '_image_upload', None))
+        if old_image:
+            images.release(old_image)
+    if getattr(instance, '_image_changed', False):
+        if sharding.posts_exist(
+            image=instance.image.name, thumbnail_ready=True
+        ):
+            # Миниатюры этого файла уже созданы для другого поста.
+            sharding.author_posts(instance.author_id).filter(
+                pk=instance.pk
+            ).update(thumbnail_ready=True)
+            instance.thumbnail_ready = True
+        else:
+            thumbnails.enqueue(instance)
+    caching.invalidate_post_pages(
+        instance, getattr(instance, '_old_group_id', None)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    if instance.image:
+        images.release(instance.image.name)
+    search.remove(instance.pk, using=instance._state.db)
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    timeline.drop_stream(instance.author_id)
+    caching.invalidate_post_pages(instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump('index', 'groups')
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_comments_count(instance.post_id, 1,
+                                       using=instance._state.db)
+    caching.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comments_count(instance.post_id, -1,
+                                   using=instance._state.db)
+    caching.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user_counter(instance.author_id, 'followers_count', 1)
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        if not sharding.enabled():
+            timeline.backfill(instance.user_id, instance.author_id)
+        invalidate_follow_pages(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    if not sharding.enabled():
+        timeline.remove(instance.user_id, instance.author_id)
+    invalidate_follow_pages(instance)
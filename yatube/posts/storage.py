@@ -0,0 +1,47 @@
+"""Хранилище изображений постов с адресацией по содержимому.
+
+Имя файла — SHA-256 его содержимого, поэтому повторная загрузка той же
+картинки не создаёт копию: все посты ссылаются на один файл и на один
+набор миниатюр sorl, имена которых зависят от имени исходника.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hashed_name(directory, digest, extension):
+    return os.path.join(directory, digest[:2], digest + extension.lower())
+
+
+def is_hashed(name):
+    directory, filename = os.path.split(name)
+    digest = os.path.splitext(filename)[0]
+    return (len(digest) == 64 and os.path.basename(directory) == digest[:2]
+            and all(char in '0123456789abcdef' for char in digest))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1]
+        name = hashed_name(directory, content_hash(content), extension)
+        if self.exists(name):
+            return name
+        # Файл пишется под временным именем и атомарно переименовывается:
+        # параллельная загрузка той же картинки запишет те же байты.
+        temporary = super()._save(
+            os.path.join(os.path.dirname(name), 'upload' + extension),
+            content
+        )
+        os.replace(self.path(temporary), self.path(name))
+        return name
@@ -0,0 +1,19 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def next_cursor(page_obj):
+    return page_obj.paginator.next_cursor(page_obj)
+
+
+@register.filter
+def previous_cursor(page_obj):
+    return page_obj.paginator.previous_cursor(page_obj)
+
+
+@register.filter
+def page_window(page_obj):
+    """Оконный список страниц: первая, последняя и соседи текущей."""
+    return page_obj.paginator.get_elided_page_range(page_obj.number)
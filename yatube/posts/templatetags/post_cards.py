@@ -0,0 +1,69 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .. import caching, thumbnails
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+CARD_KEY = (
+    'post-card:{variant}:{post.pk}:{stamp}:{post.thumbnail_ready:d}:{groups}'
+    ':{author}'
+)
+VARIANTS = {
+    'feed': {'show_author': True, 'show_group': True,
+             'show_detail_link': True},
+    'group': {'show_author': True, 'show_group': False,
+              'show_detail_link': False},
+    'profile': {'show_author': False, 'show_group': True,
+                'show_detail_link': True},
+}
+
+
+def author_stamp(author):
+    """Отпечаток выводимых в карточке данных автора."""
+    shown = f'{author.username}\n{author.get_full_name()}'
+    return hashlib.md5(shown.encode()).hexdigest()[:12]
+
+
+def card_key(post, variant, groups_version):
+    return CARD_KEY.format(
+        variant=variant,
+        post=post,
+        stamp=post.updated_at.timestamp(),
+        groups=groups_version,
+        author=author_stamp(post.author)
+    )
+
+
+@register.simple_tag
+def post_cards(posts, variant):
+    """Разметка карточек постов страницы.
+
+    Готовые карточки достаются из кеша одним `get_many`, шаблон
+    рендерится только для промахов. Ключ содержит `updated_at` поста,
+    готовность миниатюры и отпечаток имени автора, так что правка
+    поста, готовая миниатюра или переименование автора сами делают
+    старую карточку недоступной.
+    """
+    posts = list(posts)
+    groups_version, = caching.versions(['groups'])
+    keys = [card_key(post, variant, groups_version) for post in posts]
+    cards = cache.get_many(keys)
+    missed = [(key, post) for key, post in zip(keys, posts)
+              if key not in cards]
+    thumbnails.prefetch([post for key, post in missed], 'card')
+    rendered = {
+        key: render_to_string(
+            CARD_TEMPLATE, {'post': post, **VARIANTS[variant]}
+        )
+        for key, post in missed
+    }
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIME)
+        cards.update(rendered)
+    return [cards[key] for key in keys]
@@ -0,0 +1,11 @@
+from django import template
+
+from .. import search
+
+register = template.Library()
+
+
+@register.filter
+def highlight(snippet):
+    """Фрагмент поста с найденными словами в `<mark>`."""
+    return search.highlight(snippet)
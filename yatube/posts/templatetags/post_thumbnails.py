@@ -0,0 +1,11 @@
+from django import template
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_picture(post, preset_name):
+    """Варианты миниатюры для `<picture>` и её размеры на странице."""
+    return thumbnails.picture(post, preset_name)
@@ -0,0 +1,217 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from .. import caching
+from ..models import Comment, Group, Post, User
+
+
+class VersionedPageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test_group',
+            description='Description of test group'
+        )
+        cls.other_group = Group.objects.create(
+            title='Other group',
+            slug='other_group',
+            description='Description of other group'
+        )
+        cls.post = Post.objects.create(
+            text='Original text', author=cls.author, group=cls.group
+        )
+        cls.INDEX = reverse('posts:index')
+        cls.GROUP = reverse('posts:group_list', kwargs={'slug': 'test_group'})
+        cls.OTHER_GROUP = reverse(
+            'posts:group_list', kwargs={'slug': 'other_group'}
+        )
+        cls.PROFILE = reverse('posts:profile', kwargs={'username': 'author'})
+        cls.DETAIL = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post.pk}
+        )
+        cls.PAGES = [cls.INDEX, cls.GROUP, cls.PROFILE, cls.DETAIL]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def warm_up(self, pages):
+        for page in pages:
+            self.client.get(page)
+
+    def test_pages_are_served_from_cache(self):
+        self.warm_up(self.PAGES)
+        Post.objects.filter(pk=self.post.pk).update(text='Silent update')
+        for page in self.PAGES:
+            with self.subTest(page=page):
+                response = self.client.get(page)
+                self.assertContains(response, 'Original text')
+
+    def test_browser_revalidates_cached_pages(self):
+        self.warm_up(self.PAGES)
+        for page in self.PAGES:
+            with self.subTest(page=page):
+                response = self.client.get(page)
+                self.assertEqual(response['Cache-Control'], 'no-cache')
+                self.assertFalse(response.has_header('Expires'))
+
+    def test_new_post_invalidates_its_scopes(self):
+        self.warm_up(self.PAGES + [self.OTHER_GROUP])
+        Post.objects.create(
+            text='Brand new post', author=self.author, group=self.group
+        )
+        for page in [self.INDEX, self.GROUP, self.PROFILE]:
+            with self.subTest(page=page):
+                self.assertContains(self.client.get(page), 'Brand new post')
+        self.assertIsNone(self.client.get(self.OTHER_GROUP).context)
+
+    def test_moving_post_invalidates_both_groups(self):
+        self.warm_up([self.GROUP, self.OTHER_GROUP])
+        self.post.group = self.other_group
+        self.post.save()
+        self.assertNotContains(self.client.get(self.GROUP), 'Original text')
+        self.assertContains(self.client.get(self.OTHER_GROUP), 'Original text')
+
+    def test_comment_invalidates_post_detail(self):
+        self.warm_up([self.DETAIL])
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Fresh comment'
+        )
+        self.assertContains(self.client.get(self.DETAIL), 'Fresh comment')
+
+    def test_group_change_invalidates_index(self):
+        self.warm_up([self.INDEX])
+        self.group.slug = 'renamed_group'
+        self.group.save()
+        self.assertContains(self.client.get(self.INDEX), 'renamed_group')
+
+    def test_author_rename_invalidates_pages(self):
+        self.warm_up(self.PAGES)
+        self.author.first_name = 'Новое'
+        self.author.last_name = 'Имя'
+        self.author.save()
+        for page in self.PAGES:
+            with self.subTest(page=page):
+                self.assertContains(self.client.get(page), 'Новое Имя')
+
+    def test_login_keeps_cached_pages(self):
+        self.author.set_password('password')
+        self.author.save()
+        scope = ['index', 'groups', 'author:author']
+        before = caching.versions(scope)
+        self.assertTrue(
+            Client().login(username='author', password='password')
+        )
+        self.assertEqual(caching.versions(scope), before)
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        for number in range(12):
+            Post.objects.create(text=f'Post {number}', author=cls.author)
+        cls.INDEX = reverse('posts:index')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_logged_in_user_bypasses_cache(self):
+        client = Client()
+        client.force_login(self.author)
+        client.get(self.INDEX)
+        response = client.get(self.INDEX)
+        self.assertNotIn(caching.CACHE_HEADER, response)
+        self.assertIsNotNone(response.context)
+
+    def test_anonymous_visitors_share_copy(self):
+        Client().get(self.INDEX)
+        visitor = Client()
+        visitor.cookies['csrftoken'] = 'x' * 32
+        response = visitor.get(self.INDEX)
+        self.assertEqual(response[caching.CACHE_HEADER], 'HIT')
+
+    def test_key_includes_page_and_cursor(self):
+        client = Client()
+        client.get(self.INDEX)
+        for params in ({'page': 2}, {'cursor': 'abc'}):
+            with self.subTest(params=params):
+                response = client.get(self.INDEX, params)
+                self.assertEqual(response[caching.CACHE_HEADER], 'MISS')
+        response = client.get(self.INDEX, {'page': 2, 'utm_source': 'mail'})
+        self.assertEqual(response[caching.CACHE_HEADER], 'HIT')
+        self.assertContains(response, 'Post 0')
+
+    def test_search_is_cached_per_query(self):
+        client = Client()
+        address = reverse('posts:search')
+        client.get(address, {'q': 'post'})
+        self.assertEqual(
+            client.get(address, {'q': 'post'})[caching.CACHE_HEADER], 'HIT'
+        )
+        self.assertEqual(
+            client.get(address, {'q': 'other'})[caching.CACHE_HEADER], 'MISS'
+        )
+
+    def test_response_with_csrf_token_is_not_cached(self):
+        request = RequestFactory().get(self.INDEX)
+        response = Client().get(self.INDEX)
+        self.assertTrue(caching._should_cache(request, response))
+        request.META['CSRF_COOKIE_USED'] = True
+        self.assertFalse(caching._should_cache(request, response))
+
+
+class StaleWhileRevalidateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='First text', author=cls.author)
+        cls.INDEX = reverse('posts:index')
+
+    def setUp(self):
+        # Счётчики других тестов, накопленные в памяти процесса.
+        caching.flush_stats()
+        cache.clear()
+        self.client = Client()
+
+    def test_hits_and_misses_are_counted(self):
+        first = self.client.get(self.INDEX)
+        second = self.client.get(self.INDEX)
+        self.assertEqual(first[caching.CACHE_HEADER], 'MISS')
+        self.assertEqual(second[caching.CACHE_HEADER], 'HIT')
+        self.assertEqual(
+            caching.stats('index'), {'hit': 1, 'miss': 1, 'stale': 0}
+        )
+
+    def test_hit_does_not_write_to_cache(self):
+        self.client.get(self.INDEX)
+        with mock.patch.object(caching.cache, 'incr') as incr, \
+                mock.patch.object(caching.cache, 'add') as add:
+            response = self.client.get(self.INDEX)
+        self.assertEqual(response[caching.CACHE_HEADER], 'HIT')
+        incr.assert_not_called()
+        add.assert_not_called()
+
+    def test_changed_version_is_never_served_stale(self):
+        self.client.get(self.INDEX)
+        Post.objects.create(text='Second text', author=self.author)
+        with mock.patch.object(caching, 'acquire_lock', return_value=False):
+            response = self.client.get(self.INDEX)
+        self.assertEqual(response[caching.CACHE_HEADER], 'MISS')
+        self.assertContains(response, 'Second text')
+
+    @override_settings(PAGE_CACHE={'default': {'TTL': 0, 'GRACE': 60}})
+    def test_soft_expired_copy_is_recomputed_by_lock_holder(self):
+        self.client.get(self.INDEX)
+        with mock.patch.object(caching, 'acquire_lock', return_value=False):
+            self.assertEqual(
+                self.client.get(self.INDEX)[caching.CACHE_HEADER], 'STALE'
+            )
+        self.assertEqual(
+            self.client.get(self.INDEX)[caching.CACHE_HEADER], 'MISS'
+        )
@@ -0,0 +1,139 @@
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+
+from .. import caching
+from ..conditional import conditional
+from ..models import Comment, Follow, Group, Post, User
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group
+        )
+        cls.DETAIL = reverse('posts:post_detail',
+                             kwargs={'post_id': cls.post.pk})
+        cls.PROFILE = reverse('posts:profile',
+                              kwargs={'username': 'author'})
+        cls.GROUP = reverse('posts:group_list', kwargs={'slug': 'group'})
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def etag(self, address, client=None):
+        return (client or self.client).get(address)['ETag']
+
+    def test_pages_have_validators(self):
+        for address in (self.DETAIL, self.PROFILE, self.GROUP):
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertTrue(response.has_header('ETag'))
+                self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_repeat_visit_is_not_modified(self):
+        for address in (self.DETAIL, self.PROFILE, self.GROUP):
+            with self.subTest(address=address):
+                etag = self.etag(address)
+                # Только сессия и пользователь: версии берутся из кеша,
+                # контекст шаблона не собирается.
+                with self.assertNumQueries(2):
+                    response = self.client.get(
+                        address, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertIsNone(response.context)
+
+    def test_deleted_newest_post_is_not_hidden_by_if_modified_since(self):
+        newest = Post.objects.create(text='Новый пост', author=self.author)
+        self.client.get(self.PROFILE)
+        newest.delete()
+        response = self.client.get(
+            self.PROFILE, HTTP_IF_MODIFIED_SINCE=http_date()
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_comment_changes_post_etag(self):
+        etag = self.etag(self.DETAIL)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        response = self.client.get(self.DETAIL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_edit_changes_group_and_profile_etags(self):
+        etags = [self.etag(self.PROFILE), self.etag(self.GROUP)]
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertNotEqual(
+            [self.etag(self.PROFILE), self.etag(self.GROUP)], etags
+        )
+
+    def test_deleted_post_changes_group_etag(self):
+        extra = Post.objects.create(text='Ещё пост', author=self.author,
+                                    group=self.group)
+        etag = self.etag(self.GROUP)
+        extra.delete()
+        self.assertNotEqual(self.etag(self.GROUP), etag)
+
+    def test_group_rename_changes_post_etag(self):
+        etag = self.etag(self.DETAIL)
+        self.group.title = 'Новое название'
+        self.group.save()
+        response = self.client.get(self.DETAIL, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новое название')
+
+    def test_author_rename_changes_profile_etag(self):
+        etag = self.etag(self.PROFILE)
+        self.author.first_name = 'Новое'
+        self.author.save()
+        response = self.client.get(self.PROFILE, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новое')
+
+    def test_deleted_author_is_not_modified_no_more(self):
+        author = User.objects.create_user(username='gone')
+        address = reverse('posts:profile', kwargs={'username': 'gone'})
+        etag = self.etag(address)
+        author.delete()
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_follow_state_changes_profile_etag(self):
+        etag = self.etag(self.PROFILE)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertNotEqual(self.etag(self.PROFILE), etag)
+
+    def test_etag_depends_on_viewer(self):
+        self.assertNotEqual(self.etag(self.PROFILE),
+                            self.etag(self.PROFILE, Client()))
+
+    def test_missing_page_has_no_validators(self):
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'missing'})
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_stale_copy_is_sent_without_validators(self):
+        def view(request, post_id):
+            response = HttpResponse('Старая копия')
+            response[caching.CACHE_HEADER] = caching.STALE.upper()
+            return response
+
+        request = RequestFactory().get(self.DETAIL)
+        request.user = self.reader
+        response = conditional(caching.post_scope)(view)(
+            request, self.post.pk
+        )
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
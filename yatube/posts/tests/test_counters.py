@@ -0,0 +1,76 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post, User, UserStats
+from .utils import QueryBudgetMixin
+
+
+class CountersTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Text', author=cls.author)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_write_paths_update_counters(self):
+        Post.objects.create(text='Second', author=self.author)
+        Comment.objects.create(post=self.post, author=self.reader, text='Hi')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.post.comments.all().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_drifted_counters_do_not_go_below_zero(self):
+        Post.objects.bulk_create([Post(text='Bulk', author=self.reader)])
+        post = Post.objects.get(text='Bulk')
+        Comment.objects.bulk_create(
+            [Comment(post=post, author=self.author, text='Hi')]
+        )
+        post.comments.all().delete()
+        post.delete()
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+
+    def test_profile_and_detail_read_counters_without_count(self):
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        client = Client()
+        client.force_login(self.reader)
+        for address in (
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ):
+            with self.subTest(address=address):
+                # Число постов для пагинации считается один раз на версию
+                # ленты автора и дальше берётся из кеша.
+                client.get(address)
+                with self.assertMaxQueries(5) as context:
+                    response = client.get(address)
+                self.assertEqual(response.context['post_count'], 42)
+                self.assertFalse(any(
+                    'COUNT(' in query['sql']
+                    for query in context.captured_queries
+                ))
+
+    def test_reconcile_command_fixes_drift(self):
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=self.post.pk).update(comments_count=7)
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
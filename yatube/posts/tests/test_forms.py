@@ -8,6 +8,7 @@ from django.urls import reverse
 
 from ..forms import PostForm
 from ..models import Group, Post, User
+from ..storage import content_hash, hashed_name
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -87,13 +88,15 @@ class PostFormsTest(TestCase):
         )
         self.assertRedirects(response, self.ADDRESSES[0])
         self.assertEqual(Post.objects.count(), posts_count + 1)
-        self.assertTrue(
-            Post.objects.filter(
-                text=self.CREATED_TEXT,
-                author=self.user,
-                group=self.group,
-                image='posts/small.gif'
-            ).exists()
+        created = Post.objects.filter(
+            text=self.CREATED_TEXT,
+            author=self.user,
+            group=self.group
+        )
+        self.assertTrue(created.exists())
+        image = created.get().image
+        self.assertEqual(
+            image.name, hashed_name('posts', content_hash(image), '.gif')
         )
 
     def test_edit_post(self):
@@ -0,0 +1,202 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from .. import thumbnails
+from ..models import Post, StoredImage, ThumbnailTask, User
+from ..storage import (ContentAddressedStorage, content_hash, hashed_name,
+                       is_hashed)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def image_bytes(color=(200, 10, 10)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (30, 20), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def upload(content, name='photo.png'):
+    return SimpleUploadedFile(
+        name=name, content=content, content_type='image/png'
+    )
+
+
+class ImageStorageMixin:
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, image, text='Post'):
+        return Post.objects.create(text=text, author=self.user, image=image)
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(ImageStorageMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create_post(upload(image_bytes(), 'first.png'))
+        second = self.create_post(upload(image_bytes(), 'second.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_hashed(first.image.name))
+        self.assertEqual(
+            first.image.name,
+            hashed_name('posts', content_hash(first.image), '.png')
+        )
+        self.assertEqual(
+            StoredImage.objects.get(name=first.image.name).references, 2
+        )
+
+    def test_different_uploads_get_different_files(self):
+        first = self.create_post(upload(image_bytes((0, 0, 0))))
+        second = self.create_post(upload(image_bytes((0, 0, 255))))
+        self.assertNotEqual(first.image.name, second.image.name)
+
+    def test_shared_file_reuses_ready_thumbnails(self):
+        first = self.create_post(upload(image_bytes((10, 10, 10))))
+        call_command('generate_thumbnails', workers=1, stdout=mock.Mock())
+        second = self.create_post(upload(image_bytes((10, 10, 10))))
+        second.refresh_from_db()
+        self.assertTrue(second.thumbnail_ready)
+        self.assertFalse(ThumbnailTask.objects.filter(post=second).exists())
+        first.refresh_from_db()
+        self.assertTrue(first.thumbnail_ready)
+
+    def test_replaced_image_releases_old_file(self):
+        post = self.create_post(upload(image_bytes((1, 2, 3))))
+        old_name = post.image.name
+        post.image = upload(image_bytes((3, 2, 1)))
+        post.save()
+        self.assertEqual(StoredImage.objects.get(name=old_name).references, 0)
+        self.assertEqual(
+            StoredImage.objects.get(name=post.image.name).references, 1
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageDeletionTest(ImageStorageMixin, TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+
+    def test_file_is_kept_while_referenced(self):
+        first = self.create_post(upload(image_bytes((50, 50, 50))))
+        second = self.create_post(upload(image_bytes((50, 50, 50))))
+        name = first.image.name
+        first.delete()
+        self.assertTrue(self.exists(name))
+        second.delete()
+        self.assertFalse(self.exists(name))
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+
+    def test_thumbnails_are_deleted_with_file(self):
+        post = self.create_post(upload(image_bytes((60, 60, 60))))
+        call_command('generate_thumbnails', workers=1, stdout=mock.Mock())
+        post.refresh_from_db()
+        thumbnail_names = [
+            image.name for image in thumbnails.lookup(
+                post, 'card'
+            ).values()
+        ]
+        self.assertTrue(thumbnail_names)
+        post.delete()
+        for name in thumbnail_names:
+            self.assertFalse(self.exists(name))
+
+    def test_upload_racing_with_deletion_keeps_file(self):
+        post = self.create_post(upload(image_bytes((70, 70, 70))))
+        name = post.image.name
+        save = ContentAddressedStorage._save
+
+        def save_then_delete(storage, *args):
+            saved = save(storage, *args)
+            # Последний пост с этим файлом удаляется, когда загрузка уже
+            # нашла файл, но ещё не записала ссылку на него.
+            if post.pk is not None:
+                post.delete()
+            return saved
+
+        with mock.patch.object(
+            ContentAddressedStorage, '_save', save_then_delete
+        ):
+            second = self.create_post(upload(image_bytes((70, 70, 70))))
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(self.exists(name))
+        self.assertEqual(StoredImage.objects.get(name=name).references, 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DedupeImagesCommandTest(ImageStorageMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+
+    def setUp(self):
+        shutil.rmtree(os.path.join(TEMP_MEDIA_ROOT, 'posts'),
+                      ignore_errors=True)
+        # Файлы, загруженные до адресного хранилища, лежат под своими
+        # именами.
+        self.legacy = FileSystemStorage(location=TEMP_MEDIA_ROOT)
+        self.content = image_bytes((90, 90, 90))
+        self.names = [
+            self.legacy.save(f'posts/copy-{number}.png',
+                             ContentFile(self.content))
+            for number in range(3)
+        ]
+        self.posts = [self.create_post(name) for name in self.names]
+
+    def dedupe(self, **options):
+        out = io.StringIO()
+        call_command('dedupe_images', stdout=out, **options)
+        return out.getvalue()
+
+    def test_copies_are_merged_into_one_file(self):
+        output = self.dedupe()
+        target = hashed_name(
+            'posts', content_hash(ContentFile(self.content)), '.png'
+        )
+        for post in self.posts:
+            post.refresh_from_db()
+            self.assertEqual(post.image.name, target)
+        self.assertTrue(self.exists(target))
+        for name in self.names:
+            self.assertFalse(self.exists(name))
+        self.assertEqual(StoredImage.objects.get(name=target).references, 3)
+        self.assertIn('Объединено копий: 3', output)
+        self.assertIn(f'({2 * len(self.content)} байт)', output)
+
+    def test_moved_posts_are_queued_for_thumbnails(self):
+        self.dedupe()
+        self.assertEqual(
+            set(ThumbnailTask.objects.values_list('post_id', flat=True)),
+            {post.pk for post in self.posts}
+        )
+
+    def test_dry_run_changes_nothing(self):
+        output = self.dedupe(dry_run=True)
+        for post, name in zip(self.posts, self.names):
+            post.refresh_from_db()
+            self.assertEqual(post.image.name, name)
+            self.assertTrue(self.exists(name))
+        self.assertIn(f'({2 * len(self.content)} байт)', output)
+
+    def test_unique_files_are_left_alone(self):
+        self.dedupe()
+        output = self.dedupe()
+        self.assertIn('Объединено копий: 0', output)
@@ -1,8 +1,11 @@
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from ..models import Group, Post, User
+from ..paginators import CursorPaginator
 
 
 class PaginatorViewsTest(TestCase):
@@ -62,3 +65,240 @@ class PaginatorViewsTest(TestCase):
                     len(response.context['page_obj']),
                     self.SECOND_PAGE_COUNT_POSTS
                 )
+
+    def test_cursor_pages_continue_numbered_pages(self):
+        for address in self.PAGES_ADDRESSES:
+            with self.subTest(address=address):
+                first_page = self.authorized_client.get(
+                    address
+                ).context['page_obj']
+                response = self.authorized_client.get(
+                    address,
+                    {'cursor': first_page.paginator.next_cursor(first_page)}
+                )
+                page_obj = response.context['page_obj']
+                self.assertIsNone(page_obj.number)
+                self.assertFalse(page_obj.has_next())
+                self.assertEqual(
+                    list(page_obj),
+                    list(Post.objects.order_by('-pub_date', '-pk')[
+                        self.FIRST_PAGE_COUNT_POSTS:
+                    ])
+                )
+
+    def test_previous_cursor_returns_to_first_page(self):
+        address = self.PAGES_ADDRESSES[0]
+        first_page = self.authorized_client.get(address).context['page_obj']
+        second_page = self.authorized_client.get(
+            address, {'cursor': first_page.paginator.next_cursor(first_page)}
+        ).context['page_obj']
+        response = self.authorized_client.get(
+            address,
+            {'cursor': second_page.paginator.previous_cursor(second_page)}
+        )
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(list(response.context['page_obj']), list(first_page))
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.authorized_client.get(
+            self.PAGES_ADDRESSES[0], {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(
+            len(response.context['page_obj']), self.FIRST_PAGE_COUNT_POSTS
+        )
+
+    def test_empty_cursor_page_has_no_cursor_links(self):
+        oldest = Post.objects.order_by('pub_date', 'pk').first()
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        cursor = paginator.make_cursor(paginator.cursor_key(oldest))
+        response = self.authorized_client.get(
+            self.PAGES_ADDRESSES[0], {'cursor': cursor}
+        )
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertNotContains(response, 'cursor=None')
+
+
+class PageWindowTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+
+    def add_posts(self, count):
+        Post.objects.bulk_create(
+            Post(text='Пост', author=self.user) for _ in range(count)
+        )
+
+    def test_page_range_is_elided(self):
+        paginator = CursorPaginator(Post.objects.none(), 10, count=1000)
+        gap = paginator.ELLIPSIS
+        self.assertEqual(list(paginator.get_elided_page_range(1)),
+                         [1, 2, 3, gap, 100])
+        self.assertEqual(list(paginator.get_elided_page_range(50)),
+                         [1, gap, 48, 49, 50, 51, 52, gap, 100])
+        self.assertEqual(list(paginator.get_elided_page_range(99)),
+                         [1, gap, 97, 98, 99, 100])
+        short = CursorPaginator(Post.objects.none(), 10, count=40)
+        self.assertEqual(list(short.get_elided_page_range(2)),
+                         [1, 2, 3, 4])
+
+    def test_response_size_does_not_grow_with_page_count(self):
+        # Число страниц растёт со 150 до 990, а разрядность номеров
+        # страниц и id постов в курсорах не меняется.
+        self.add_posts(1500)
+        address = reverse('posts:index')
+        before = [len(self.client.get(address, {'page': page}).content)
+                  for page in (1, 50)]
+        self.add_posts(8400)
+        cache.clear()
+        after = [len(self.client.get(address, {'page': page}).content)
+                 for page in (1, 50)]
+        self.assertEqual(after, before)
+
+
+class FeedCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        for _ in range(12):
+            Post.objects.create(text='Пост', author=cls.user,
+                                group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        # Авторизованным страницы не кешируются.
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def counts(self, address):
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(address).context['page_obj']
+        counting = [query for query in queries
+                    if 'COUNT(' in query['sql'] and 'posts_post' in
+                    query['sql'] and 'LIMIT' not in query['sql']]
+        return page.paginator.count, len(counting)
+
+    def test_feed_count_is_cached(self):
+        for address in (reverse('posts:index'),
+                        reverse('posts:group_list', kwargs={'slug': 'group'})):
+            with self.subTest(address=address):
+                self.assertEqual(self.counts(address), (12, 1))
+                self.assertEqual(self.counts(address), (12, 0))
+
+    def test_new_post_refreshes_count(self):
+        address = reverse('posts:group_list', kwargs={'slug': 'group'})
+        self.counts(address)
+        Post.objects.create(text='Новый', author=self.user, group=self.group)
+        self.assertEqual(self.counts(address), (13, 1))
+
+    @override_settings(FEED_COUNT_ESTIMATE_ABOVE=5)
+    def test_large_unfiltered_feed_is_estimated(self):
+        Post.objects.filter(pk__in=Post.objects.order_by('pk')[:2]).delete()
+        top = Post.objects.order_by('-pk').first().pk
+        paginator = CursorPaginator(Post.objects.all(), 2, count_key='test')
+        self.assertEqual(paginator.count, top)
+        self.assertTrue(paginator.approximate)
+        gap = paginator.ELLIPSIS
+        self.assertEqual(list(paginator.get_elided_page_range(1)),
+                         [1, 2, 3, gap])
+        group = CursorPaginator(self.group.posts.all(), 2, count_key='group')
+        self.assertEqual(group.count, 10)
+        self.assertFalse(group.approximate)
+
+    @override_settings(FEED_COUNT_ESTIMATE_ABOVE=5)
+    def test_template_shows_approximate_page_count(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'из примерно 2')
+        self.assertNotContains(response, 'Последняя')
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'group'})
+        )
+        self.assertNotContains(response, 'примерно')
+        self.assertContains(response, 'Последняя')
+
+
+class DeepPageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=user) for number in range(35)
+        )
+        cls.expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list('pk',
+                                                                  flat=True)
+        )
+
+    def page_ids(self, paginator, number):
+        with CaptureQueriesContext(connection) as queries:
+            ids = [post.pk for post in paginator.page(number)]
+        return ids, queries[-1]['sql']
+
+    def test_pages_keep_feed_order(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        for number in paginator.page_range:
+            with self.subTest(page=number):
+                ids, sql = self.page_ids(paginator, number)
+                bottom = (number - 1) * 10
+                self.assertEqual(ids, self.expected[bottom:bottom + 10])
+
+    def test_back_pages_are_read_from_the_end(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        ids, sql = self.page_ids(paginator, paginator.num_pages)
+        self.assertNotIn('OFFSET', sql)
+        self.assertIn('ASC', sql)
+        ids, sql = self.page_ids(paginator, 3)
+        self.assertIn('OFFSET 5', sql)
+        ids, sql = self.page_ids(paginator, 2)
+        self.assertIn('OFFSET 10', sql)
+
+    def test_drifted_count_keeps_every_post_once(self):
+        # Денормализованный счётчик автора разошёлся с лентой.
+        for count in (34, 36):
+            with self.subTest(count=count):
+                paginator = CursorPaginator(Post.objects.all(), 10,
+                                            count=count)
+                ids = []
+                for number in paginator.page_range:
+                    ids += self.page_ids(paginator, number)[0]
+                self.assertEqual(ids, self.expected)
+
+    def test_last_feed_pages_are_read_from_the_end(self):
+        cache.clear()
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        Post.objects.all().update(group=group)
+        client = Client()
+        client.force_login(User.objects.get(username='author'))
+        for address in (reverse('posts:index'),
+                        reverse('posts:group_list', kwargs={'slug': 'group'}),
+                        reverse('posts:profile',
+                                kwargs={'username': 'author'})):
+            with self.subTest(address=address):
+                # Второй запрос берёт число постов из кеша.
+                for _ in range(2):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(address, {'page': 4})
+                page = response.context['page_obj']
+                self.assertEqual([post.pk for post in page],
+                                 self.expected[30:])
+                feed = [query['sql'] for query in queries
+                        if 'FROM "posts_post"' in query['sql']
+                        and 'LIMIT' in query['sql']]
+                self.assertTrue(feed)
+                for sql in feed:
+                    self.assertNotIn('OFFSET', sql)
+
+    @override_settings(FEED_COUNT_ESTIMATE_ABOVE=5)
+    def test_approximate_count_reads_from_the_start(self):
+        cache.clear()
+        paginator = CursorPaginator(Post.objects.all(), 10, count_key='test')
+        ids, sql = self.page_ids(paginator, 4)
+        self.assertEqual(ids, self.expected[30:])
+        self.assertIn('OFFSET 30', sql)
@@ -0,0 +1,98 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..models import Group, Post, User
+from ..templatetags import post_cards
+
+
+class PostCardsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test_group',
+            description='Description of test group'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Post {number}', author=cls.author, group=cls.group
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, variant='feed'):
+        return post_cards.post_cards(
+            Post.objects.select_related('author', 'group'), variant
+        )
+
+    def test_cards_are_rendered_once(self):
+        first = self.render()
+        with mock.patch.object(
+            post_cards, 'render_to_string',
+            side_effect=AssertionError('Карточка отрендерена повторно')
+        ):
+            self.assertEqual(self.render(), first)
+
+    def test_cards_are_fetched_with_one_get_many(self):
+        self.render()
+        with mock.patch.object(
+            post_cards.cache, 'get_many', wraps=post_cards.cache.get_many
+        ) as get_many, mock.patch.object(
+            post_cards.cache, 'get', wraps=post_cards.cache.get
+        ) as get:
+            self.render()
+        # Второй get_many — чтение версии пространства имён групп.
+        card_calls = [call for call in get_many.call_args_list
+                      if any('post-card' in key for key in call[0][0])]
+        self.assertEqual(len(card_calls), 1)
+        get.assert_not_called()
+
+    def test_edit_renders_new_card(self):
+        self.render()
+        post = self.posts[0]
+        post.text = 'Edited text'
+        post.save()
+        cards = self.render()
+        self.assertTrue(any('Edited text' in card for card in cards))
+
+    def test_silent_update_keeps_cached_card(self):
+        self.render()
+        Post.objects.filter(pk=self.posts[0].pk).update(text='Silent update')
+        cards = self.render()
+        self.assertFalse(any('Silent update' in card for card in cards))
+
+    def test_group_change_renders_new_card(self):
+        self.render()
+        self.group.slug = 'renamed_group'
+        self.group.save()
+        cards = self.render()
+        self.assertTrue(all('renamed_group' in card for card in cards))
+
+    def test_author_rename_renders_new_card(self):
+        self.render()
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'renamed'
+        author.first_name = 'Новое'
+        author.last_name = 'Имя'
+        author.save()
+        cards = self.render()
+        self.assertTrue(all('Новое Имя' in card for card in cards))
+        self.assertTrue(all('/profile/renamed/' in card for card in cards))
+
+    def test_variants_are_cached_separately(self):
+        feed = self.render('feed')
+        group = self.render('group')
+        self.assertIn('подробная информация', feed[0])
+        self.assertNotIn('подробная информация', group[0])
+
+    def test_cached_cards_are_not_escaped(self):
+        self.render()
+        cards = self.render()
+        self.assertIn('<article>', str(cards[0]))
+        self.assertTrue(hasattr(cards[0], '__html__'))
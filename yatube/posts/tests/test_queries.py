@@ -0,0 +1,83 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+from .utils import QueryBudgetMixin
+
+
+class FeedQueryBudgetTest(QueryBudgetMixin, TestCase):
+    FEED_BUDGET = 7
+    # Включая запрос валидаторов условного GET.
+    DETAIL_BUDGET = 6
+    EXTRA_POSTS = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test_group',
+            description='Description of test group'
+        )
+        cls.post = Post.objects.create(
+            text='Text of test post',
+            author=cls.author,
+            group=cls.group
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Comment'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.feeds = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.author.username}),
+            reverse('posts:follow_index'),
+        ]
+        cls.detail = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post.pk}
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def count_queries(self, address, budget):
+        cache.clear()
+        with self.assertMaxQueries(budget) as context:
+            self.client.get(address)
+        return len(context.captured_queries)
+
+    def add_content(self):
+        for number in range(self.EXTRA_POSTS):
+            Post.objects.create(
+                text=f'Post {number}', author=self.author, group=self.group
+            )
+            Comment.objects.create(
+                post=self.post, author=self.reader, text=f'Comment {number}'
+            )
+
+    def test_feeds_do_not_depend_on_page_size(self):
+        before = {
+            address: self.count_queries(address, self.FEED_BUDGET)
+            for address in self.feeds
+        }
+        self.add_content()
+        for address in self.feeds:
+            with self.subTest(address=address):
+                self.assertEqual(
+                    self.count_queries(address, self.FEED_BUDGET),
+                    before[address]
+                )
+
+    def test_post_detail_does_not_depend_on_comment_count(self):
+        before = self.count_queries(self.detail, self.DETAIL_BUDGET)
+        self.add_content()
+        self.assertEqual(
+            self.count_queries(self.detail, self.DETAIL_BUDGET), before
+        )
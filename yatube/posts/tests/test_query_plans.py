@@ -0,0 +1,129 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import timeline
+from ..models import Comment, Follow, Group, Post, User
+
+# Полный просмотр таблицы без индекса: `SCAN posts_post` (в старых
+# версиях SQLite — `SCAN TABLE posts_post`).
+TABLE_SCAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTest(TestCase):
+    """Запросы страниц идут по индексам, без полного просмотра и сортировки.
+
+    План строится для SQL, который страница действительно выполнила,
+    поэтому тест ловит и новые запросы, и изменения старых.
+    """
+
+    POSTS = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(cls.POSTS):
+            cls.post = Post.objects.create(
+                text=f'Пост номер {number}', author=cls.author,
+                group=cls.group
+            )
+        for number in range(3):
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Комментарий {number}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def executed(self, address, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(address, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+
+    def assertIndexedPlans(self, queries, ranked=False):
+        for sql in queries:
+            plan = query_plan(sql)
+            with self.subTest(sql=sql, plan=plan):
+                for step in plan:
+                    self.assertIsNone(TABLE_SCAN.match(step))
+                    if ranked and step == f'{TEMP_SORT} FOR ORDER BY':
+                        # Найденные посты неизбежно сортируются по
+                        # релевантности.
+                        continue
+                    self.assertNotIn(TEMP_SORT, step)
+
+    def assertPagesIndexed(self, address, ranked=False, **params):
+        response, queries = self.executed(address, **params)
+        self.assertIndexedPlans(queries, ranked)
+        page_obj = response.context['page_obj']
+        cursor = page_obj.paginator.next_cursor(page_obj)
+        self.assertIsNotNone(cursor)
+        response, queries = self.executed(address, cursor=cursor, **params)
+        self.assertIndexedPlans(queries, ranked)
+        page_obj = response.context['page_obj']
+        cursor = page_obj.paginator.previous_cursor(page_obj)
+        self.assertIndexedPlans(
+            self.executed(address, cursor=cursor, **params)[1], ranked
+        )
+
+    def test_index(self):
+        self.assertPagesIndexed(reverse('posts:index'))
+
+    def test_group_list(self):
+        self.assertPagesIndexed(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+
+    def test_profile(self):
+        self.assertPagesIndexed(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+
+    def test_follow_index(self):
+        self.assertPagesIndexed(reverse('posts:follow_index'))
+
+    @override_settings(FANOUT_FOLLOWER_LIMIT=0)
+    def test_follow_index_with_pulled_authors(self):
+        timeline.refresh_pulled_authors()
+        self.assertPagesIndexed(reverse('posts:follow_index'))
+
+    def test_search(self):
+        self.assertPagesIndexed(reverse('posts:search'), ranked=True,
+                                q='пост')
+
+    def test_post_detail(self):
+        self.assertIndexedPlans(self.executed(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )[1])
+
+    def test_post_create(self):
+        # Раскладка нового поста по лентам ищет подписчиков автора.
+        with CaptureQueriesContext(connection) as context:
+            Post.objects.create(text='Новый пост', author=self.author)
+        self.assertIndexedPlans([
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+        ])
@@ -0,0 +1,144 @@
+import io
+
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from .. import search
+from ..models import Post, User
+
+
+def indexed_ids():
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT rowid FROM {search.TABLE} ORDER BY rowid')
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SearchIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            text='Про кошек и собак', author=cls.user
+        )
+
+    def found(self, text):
+        return list(search.matching(text).values_list('pk', flat=True))
+
+    def test_created_post_is_indexed(self):
+        self.assertEqual(self.found('кошек'), [self.post.pk])
+
+    def test_edited_text_is_reindexed(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Про попугаев'
+        post.save()
+        self.assertEqual(self.found('кошек'), [])
+        self.assertEqual(self.found('попугаев'), [post.pk])
+
+    def test_deleted_post_is_removed(self):
+        Post.objects.get(pk=self.post.pk).delete()
+        self.assertEqual(indexed_ids(), [])
+
+    def test_search_is_case_insensitive_and_by_prefix(self):
+        self.assertEqual(self.found('КОШ'), [self.post.pk])
+
+    def test_operators_in_query_are_not_interpreted(self):
+        for text in ('"кошек', 'кошек OR', 'NEAR(кошек)', '*', 'text:кошек'):
+            with self.subTest(text=text):
+                self.found(text)
+        self.assertEqual(self.found('!!!'), [])
+
+    def test_highlight_escapes_html(self):
+        post = Post.objects.create(text='<b>кошек</b> много',
+                                   author=self.user)
+        snippet = search.snippets('много', [post.pk])[post.pk]
+        self.assertEqual(
+            search.highlight(snippet),
+            '&lt;b&gt;кошек&lt;/b&gt; <mark>много</mark>'
+        )
+
+    def test_rebuild_indexes_existing_posts(self):
+        Post.objects.bulk_create([
+            Post(text=f'Пост {number}', author=self.user)
+            for number in range(3)
+        ])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertEqual(indexed_ids(), sorted(
+            Post.objects.values_list('pk', flat=True)
+        ))
+        self.assertIn('Проиндексировано постов: 4', out.getvalue())
+
+    def test_admin_search_uses_index(self):
+        Post.objects.create(text='Про рыб', author=self.user)
+        admin = site._registry[Post]
+        request = RequestFactory().get('/')
+        queryset, use_distinct = admin.get_search_results(
+            request, Post.objects.all(), 'кошек'
+        )
+        self.assertEqual(list(queryset), [self.post])
+        self.assertFalse(use_distinct)
+        self.assertIn(search.TABLE, str(queryset.query))
+        self.assertNotIn('LIKE', str(queryset.query))
+
+
+@override_settings(POSTS_LIM=2)
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.URL = reverse('posts:search')
+        cls.best = Post.objects.create(
+            text='сад сад сад', author=cls.user
+        )
+        cls.others = [
+            Post.objects.create(
+                text=f'Сегодня был в саду номер {number}, сад цветёт',
+                author=cls.user
+            )
+            for number in range(4)
+        ]
+        Post.objects.create(text='Про огород', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_results_are_ranked(self):
+        response = Client().get(self.URL, {'q': 'сад'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'][0], self.best)
+
+    def test_snippet_is_highlighted(self):
+        response = Client().get(self.URL, {'q': 'огород'})
+        self.assertContains(response, 'Про <mark>огород</mark>', html=False)
+
+    def test_cursor_pages_cover_all_results(self):
+        client = Client()
+        response = client.get(self.URL, {'q': 'сад'})
+        seen = list(response.context['page_obj'])
+        page_obj = response.context['page_obj']
+        while page_obj.has_next():
+            cursor = page_obj.paginator.next_cursor(page_obj)
+            response = client.get(self.URL, {'q': 'сад', 'cursor': cursor})
+            page_obj = response.context['page_obj']
+            seen.extend(page_obj)
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), {self.best, *self.others})
+
+    def test_pagination_links_keep_query(self):
+        response = Client().get(self.URL, {'q': 'сад'})
+        self.assertContains(
+            response, 'href="?q=%D1%81%D0%B0%D0%B4&amp;cursor='
+        )
+
+    def test_empty_query_shows_form_only(self):
+        response = Client().get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['page_obj'])
+
+    def test_no_results(self):
+        response = Client().get(self.URL, {'q': 'космос'})
+        self.assertContains(response, 'ничего не найдено')
@@ -0,0 +1,228 @@
+import datetime
+import io
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import sharding
+from ..models import Comment, Follow, Post, User
+
+SHARDS = ['shard_0', 'shard_1']
+
+
+@override_settings(POST_SHARDS=SHARDS)
+class ShardingTest(TransactionTestCase):
+    databases = {'default', *SHARDS}
+
+    def setUp(self):
+        cache.clear()
+        for alias in self.databases:
+            # Соединения открыты до включения шардов в настройках.
+            sharding.configure_connection(connections[alias])
+        self.authors = self.authors_on_each_shard()
+        self.reader = User.objects.create_user(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def authors_on_each_shard(self):
+        authors, number = {}, 0
+        while len(authors) < len(SHARDS):
+            user = User.objects.create_user(username=f'author{number}')
+            authors.setdefault(sharding.shard_for(user.pk), user)
+            number += 1
+        return [authors[alias] for alias in SHARDS]
+
+    def create_posts(self, count):
+        return [
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=self.authors[number % len(self.authors)]
+            )
+            for number in range(count)
+        ]
+
+    def page_ids(self, address, **params):
+        response = self.client.get(address, params)
+        page = response.context['page_obj']
+        return [post.pk for post in page], page
+
+    def test_post_is_stored_on_author_shard(self):
+        for author in self.authors:
+            post = Post.objects.create(text='Пост', author=author)
+            alias = sharding.shard_for(author.pk)
+            self.assertEqual(post._state.db, alias)
+            self.assertTrue(
+                Post.objects.using(alias).filter(pk=post.pk).exists()
+            )
+            self.assertFalse(
+                Post.objects.using('default').filter(pk=post.pk).exists()
+            )
+
+    def test_ids_are_unique_across_shards(self):
+        posts = self.create_posts(6)
+        self.assertEqual([post.pk for post in posts],
+                         list(range(posts[0].pk, posts[0].pk + 6)))
+
+    def test_new_records_are_inserted_without_update(self):
+        author = self.authors[0]
+        alias = sharding.shard_for(author.pk)
+        with CaptureQueriesContext(connections[alias]) as queries:
+            post = Post.objects.create(text='Пост', author=author)
+            comment = Comment(post=post, author=self.reader, text='Текст')
+            comment.save()
+        updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith(('UPDATE "posts_post" SET "text"',
+                                        'UPDATE "posts_comment"'))
+        ]
+        self.assertEqual(updates, [])
+        self.assertEqual(comment._state.db, alias)
+
+    def test_deleted_user_leaves_nothing_on_shards(self):
+        post = Post.objects.create(text='Пост', author=self.authors[0])
+        Post.objects.create(text='Пост', author=self.authors[1])
+        Comment.objects.create(post=post, author=self.authors[1],
+                               text='Комментарий')
+        self.authors[1].delete()
+        remaining = [
+            (list(Post.objects.using(alias).values_list('pk', flat=True)),
+             Comment.objects.using(alias).count())
+            for alias in SHARDS
+        ]
+        self.assertEqual(remaining, [([post.pk], 0), ([], 0)])
+
+    def test_comment_is_stored_with_its_post(self):
+        post = Post.objects.create(text='Пост', author=self.authors[1])
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            data={'text': 'Комментарий'}
+        )
+        alias = sharding.shard_for(self.authors[1].pk)
+        comment = Comment.objects.using(alias).get(post_id=post.pk)
+        self.assertEqual(comment.author, self.reader)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertEqual(list(response.context['post_comments']), [comment])
+        self.assertEqual(response.context['post_author'], self.authors[1])
+
+    def test_index_merges_shards_by_pub_date(self):
+        posts = self.create_posts(settings.POSTS_LIM + 3)
+        expected = [post.pk for post in reversed(posts)]
+        first, page = self.page_ids(reverse('posts:index'))
+        self.assertEqual(first, expected[:settings.POSTS_LIM])
+        self.assertEqual(page.paginator.count, len(posts))
+        second, page = self.page_ids(
+            reverse('posts:index'),
+            cursor=page.paginator.next_cursor(page)
+        )
+        self.assertEqual(second, expected[settings.POSTS_LIM:])
+        back, page = self.page_ids(
+            reverse('posts:index'),
+            cursor=page.paginator.previous_cursor(page)
+        )
+        self.assertEqual(back, first)
+        numbered, page = self.page_ids(reverse('posts:index'), page=2)
+        self.assertEqual(numbered, second)
+
+    def test_page_has_authors_from_primary(self):
+        self.create_posts(4)
+        response = self.client.get(reverse('posts:index'))
+        posts = list(response.context['page_obj'])
+        self.assertEqual({post.author for post in posts}, set(self.authors))
+
+    def test_follow_index_reads_followed_authors(self):
+        posts = self.create_posts(4)
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        ids, page = self.page_ids(reverse('posts:follow_index'))
+        self.assertEqual(ids, [post.pk for post in reversed(posts)
+                               if post.author == self.authors[0]])
+
+    def test_profile_and_edit_use_author_shard(self):
+        post = Post.objects.create(text='Пост', author=self.reader)
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Новый текст'}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+        ids, page = self.page_ids(
+            reverse('posts:profile', kwargs={'username': 'reader'})
+        )
+        self.assertEqual(ids, [post.pk])
+
+    def test_search_merges_shards(self):
+        posts = [
+            Post.objects.create(text='Редкое слово', author=author)
+            for author in self.authors
+        ]
+        ids, page = self.page_ids(reverse('posts:search'), q='редкое')
+        self.assertEqual(sorted(ids), sorted(post.pk for post in posts))
+        self.assertEqual(page.paginator.count, len(posts))
+        self.assertIn('\x02Редкое\x03', page[0].snippet)
+
+    def test_adding_shard_moves_only_its_authors(self):
+        before = {author_id: sharding.shard_for(author_id)
+                  for author_id in range(1, 201)}
+        with override_settings(POST_SHARDS=[*SHARDS, 'shard_2']):
+            after = {author_id: sharding.shard_for(author_id)
+                     for author_id in before}
+        moved = {author_id for author_id in before
+                 if before[author_id] != after[author_id]}
+        self.assertTrue(moved)
+        self.assertLess(len(moved), len(before) / 2)
+        self.assertEqual({after[author_id] for author_id in moved},
+                         {'shard_2'})
+
+    def test_rebalance_moves_posts_from_primary(self):
+        with override_settings(POST_SHARDS=[]):
+            posts = self.create_posts(4)
+            comment = Comment.objects.create(
+                post=posts[0], author=self.reader, text='Комментарий'
+            )
+            past = timezone.now() - datetime.timedelta(days=300)
+            for number, post in enumerate(posts):
+                Post.objects.filter(pk=post.pk).update(
+                    pub_date=past + datetime.timedelta(days=number),
+                    updated_at=past + datetime.timedelta(days=number + 1)
+                )
+            Comment.objects.filter(pk=comment.pk).update(
+                created=past + datetime.timedelta(days=60)
+            )
+            dates = {
+                post.pk: (post.pub_date, post.updated_at)
+                for post in Post.objects.all()
+            }
+        out = io.StringIO()
+        call_command('rebalance_posts', batch_size=3, stdout=out)
+        self.assertIn('Перенесено постов: 4, комментариев: 1',
+                      out.getvalue())
+        self.assertFalse(Post.objects.using('default').exists())
+        for post in posts:
+            alias = sharding.shard_for(post.author_id)
+            self.assertTrue(
+                Post.objects.using(alias).filter(pk=post.pk).exists()
+            )
+        for alias in SHARDS:
+            for post in Post.objects.using(alias):
+                self.assertEqual((post.pub_date, post.updated_at),
+                                 dates[post.pk])
+        moved_comment = Comment.objects.using(
+            sharding.shard_for(posts[0].author_id)
+        ).get(post_id=posts[0].pk)
+        self.assertEqual(moved_comment.created,
+                         past + datetime.timedelta(days=60))
+        new_post = Post.objects.create(text='Новый', author=self.reader)
+        self.assertGreater(new_post.pk, posts[-1].pk)
+        ids, page = self.page_ids(reverse('posts:search'), q='пост')
+        self.assertEqual(sorted(ids), [post.pk for post in posts])
+        call_command('rebalance_posts', stdout=out)
+        self.assertIn('Перенесено постов: 0', out.getvalue())
@@ -0,0 +1,314 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+import sorl
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .. import thumbnails
+from ..models import Post, ThumbnailTask, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+PLACEHOLDER = 'Изображение обрабатывается'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailQueueTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.INDEX = reverse('posts:index')
+        cls.POST_CREATE = reverse('posts:post_create')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, name='small.gif', content=SMALL_GIF):
+        return SimpleUploadedFile(
+            name=name, content=content, content_type='image/gif'
+        )
+
+    def create_post(self, **kwargs):
+        self.client.post(self.POST_CREATE, data={
+            'text': 'Post with image', 'image': self.upload(), **kwargs
+        })
+        return Post.objects.get(text='Post with image')
+
+    def generate(self):
+        call_command('generate_thumbnails', workers=1, stdout=mock.Mock())
+
+    def test_upload_is_queued(self):
+        post = self.create_post()
+        self.assertFalse(post.thumbnail_ready)
+        self.assertTrue(ThumbnailTask.objects.filter(post=post).exists())
+
+    def test_post_without_image_is_not_queued(self):
+        Post.objects.create(text='No image', author=self.user)
+        self.assertFalse(ThumbnailTask.objects.exists())
+
+    def test_page_does_not_render_thumbnails(self):
+        self.create_post()
+        with mock.patch(
+            'sorl.thumbnail.default.engine.get_image',
+            side_effect=AssertionError('Миниатюра создаётся в запросе')
+        ):
+            response = self.client.get(self.INDEX)
+        self.assertContains(response, PLACEHOLDER)
+
+    def test_worker_generates_thumbnails(self):
+        post = self.create_post()
+        self.client.get(self.INDEX)
+        self.generate()
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_ready)
+        self.assertFalse(ThumbnailTask.objects.exists())
+        images = thumbnails.lookup(post, 'card')
+        self.assertEqual(len(images), len(thumbnails.variants('card')))
+        for image in images.values():
+            self.assertTrue(image.exists())
+        response = self.client.get(self.INDEX)
+        self.assertNotContains(response, PLACEHOLDER)
+        for (width, image_format), image in images.items():
+            self.assertContains(response, f'{image.url} {width}w')
+
+    def test_variants_are_files_of_their_format_and_width(self):
+        post = self.create_post()
+        self.generate()
+        post.refresh_from_db()
+        for (width, image_format), image in thumbnails.lookup(
+            post, 'card'
+        ).items():
+            with self.subTest(width=width, image_format=image_format):
+                self.assertEqual(image.width, width)
+                with Image.open(image.storage.path(image.name)) as file:
+                    self.assertEqual(file.format, image_format)
+
+    def test_picture_offers_webp_with_jpeg_fallback(self):
+        post = self.create_post()
+        self.generate()
+        post.refresh_from_db()
+        picture = thumbnails.picture(post, 'card')
+        self.assertEqual(
+            [source['type'] for source in picture['sources']], ['image/webp']
+        )
+        self.assertTrue(picture['src'].endswith('.jpg'))
+        self.assertEqual(picture['width'], 960)
+        self.assertIn(' 320w, ', picture['srcset'])
+
+    def test_ready_image_is_lazy_and_sized(self):
+        self.create_post()
+        self.generate()
+        response = self.client.get(self.INDEX)
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_backfill_adds_new_variants(self):
+        post = self.create_post()
+        self.generate()
+        self.client.get(self.INDEX)
+        presets = {'card': {
+            **settings.POST_THUMBNAILS['card'], 'widths': (480, 960)
+        }}
+        with override_settings(POST_THUMBNAILS=presets):
+            call_command('generate_thumbnails', workers=1, all=True,
+                         stdout=mock.Mock())
+            post.refresh_from_db()
+            self.assertIn((480, 'WEBP'), thumbnails.lookup(post, 'card'))
+            response = self.client.get(self.INDEX)
+        self.assertContains(response, ' 480w')
+
+    def test_new_image_is_queued_again(self):
+        post = self.create_post()
+        self.generate()
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Post with image', 'image': self.upload('new.gif')}
+        )
+        post.refresh_from_db()
+        self.assertFalse(post.thumbnail_ready)
+        self.assertTrue(ThumbnailTask.objects.filter(post=post).exists())
+
+    def test_text_edit_keeps_thumbnail(self):
+        post = self.create_post()
+        self.generate()
+        post.refresh_from_db()
+        post.text = 'Edited text'
+        post.save()
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_ready)
+        self.assertFalse(ThumbnailTask.objects.exists())
+
+    def create_broken_post(self):
+        return Post.objects.create(
+            text='Broken', author=self.user,
+            image=self.upload('broken.gif', b'not an image')
+        )
+
+    @override_settings(THUMBNAIL_MAX_ATTEMPTS=2, THUMBNAIL_RETRY_DELAY=0)
+    def test_broken_image_is_retried_limited_times(self):
+        post = self.create_broken_post()
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            self.generate()
+        task = ThumbnailTask.objects.get(post=post)
+        self.assertEqual(task.attempts, 2)
+        self.assertIn('Error', task.last_error)
+        self.assertEqual(list(thumbnails.failed()), [task])
+        post.refresh_from_db()
+        self.assertFalse(post.thumbnail_ready)
+        thumbnails.retry(thumbnails.failed())
+        self.assertEqual(
+            [pending.pk for pending in thumbnails.pending(10)], [task.pk]
+        )
+
+    def test_failed_task_waits_before_retry(self):
+        self.create_broken_post()
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            self.generate()
+        task = ThumbnailTask.objects.get()
+        self.assertEqual(task.attempts, 1)
+        self.assertGreater(task.retry_at, timezone.now())
+        self.assertEqual(thumbnails.pending(10), [])
+
+    def test_replaced_image_is_not_marked_ready(self):
+        post = self.create_post()
+        task, = thumbnails.pending(10)
+        Post.objects.filter(pk=post.pk).update(image='posts/other.gif')
+        self.assertFalse(thumbnails.complete(task, (2, 1), []))
+        post.refresh_from_db()
+        self.assertFalse(post.thumbnail_ready)
+
+    def test_legacy_image_keeps_its_thumbnail_key(self):
+        # Файлы до адресного хранилища обрабатывались через
+        # `default_storage`; их метаданные должны находиться по-прежнему.
+        name = default_storage.save('posts/legacy.gif',
+                                    ContentFile(SMALL_GIF))
+        post = Post.objects.create(text='Legacy', author=self.user,
+                                   image=name)
+        self.generate()
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_ready)
+        self.assertIsNotNone(
+            default.kvstore.get(ImageFile(name, default_storage))
+        )
+        self.assertEqual(len(thumbnails.lookup(post, 'card')),
+                         len(thumbnails.variants('card')))
+
+    def test_sorl_version_matches_wrapped_internals(self):
+        # Обёртки частных методов sorl сверены с этой версией.
+        self.assertEqual(sorl.__version__, thumbnails.SORL_VERSION)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailMetadataTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        for number in range(3):
+            Post.objects.create(
+                text=f'Post {number}', author=cls.user,
+                image=SimpleUploadedFile(
+                    name=f'small-{number}.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif'
+                )
+            )
+        Post.objects.create(text='Post without image', author=cls.user)
+        call_command('generate_thumbnails', workers=1, stdout=mock.Mock())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def thumbnail_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return [query['sql'] for query in context.captured_queries
+                if 'thumbnail_kvstore' in query['sql']]
+
+    def posts(self):
+        return list(Post.objects.all())
+
+    def test_cold_page_loads_metadata_with_one_query(self):
+        queries = self.thumbnail_queries(
+            lambda: Client().get(reverse('posts:index'))
+        )
+        self.assertEqual(len(queries), 1)
+
+    def test_created_thumbnails_are_written_through(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 20), (0, 200, 0)).save(buffer, 'PNG')
+        post = Post.objects.create(
+            text='New post', author=self.user,
+            image=SimpleUploadedFile(
+                name='new.png', content=buffer.getvalue(),
+                content_type='image/png'
+            )
+        )
+        call_command('generate_thumbnails', workers=1, stdout=mock.Mock())
+        post.refresh_from_db()
+        queries = self.thumbnail_queries(
+            lambda: thumbnails.prefetch([post], 'card')
+        )
+        self.assertEqual(queries, [])
+        self.assertTrue(thumbnails.lookup(post, 'card'))
+
+    def test_prefetch_matches_lookup(self):
+        posts = self.posts()
+        thumbnails.prefetch(posts, 'card')
+        self.assertEqual(
+            [bool(thumbnails.lookup(post, 'card')) for post in posts],
+            [bool(post.image) for post in posts]
+        )
+
+    def test_prefetched_lookup_skips_store(self):
+        posts = self.posts()
+        thumbnails.prefetch(posts, 'card')
+        with mock.patch.object(
+            thumbnails.default.kvstore, 'get_many',
+            side_effect=AssertionError('Лишнее обращение к хранилищу')
+        ):
+            for post in posts:
+                thumbnails.lookup(post, 'card')
+
+    def test_missing_metadata_is_cached(self):
+        posts = self.posts()
+        thumbnails.default.kvstore.clear()
+        thumbnails.prefetch(posts, 'card')
+        queries = self.thumbnail_queries(
+            lambda: thumbnails.prefetch(self.posts(), 'card')
+        )
+        self.assertEqual(queries, [])
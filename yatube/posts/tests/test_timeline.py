@@ -0,0 +1,198 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Follow, Post, TimelineEntry, User
+from ..timeline import refresh_pulled_authors, trim
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.stranger = User.objects.create_user(username='stranger')
+        cls.old_post = Post.objects.create(
+            text='Written before follow', author=cls.author
+        )
+        cls.stranger_post = Post.objects.create(
+            text='Nobody follows me', author=cls.stranger
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def timeline_posts(self):
+        return [
+            entry.post for entry in TimelineEntry.objects.filter(
+                user=self.reader
+            )
+        ]
+
+    def test_follow_backfills_and_unfollow_removes_entries(self):
+        self.client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}
+        ))
+        self.assertEqual(self.timeline_posts(), [self.old_post])
+        self.client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'author'}
+        ))
+        self.assertEqual(self.timeline_posts(), [])
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(text='Fresh', author=self.author)
+        self.assertEqual(self.timeline_posts(), [new_post, self.old_post])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.old_post]
+        )
+
+    @override_settings(TIMELINE_LIMIT=2)
+    def test_timeline_is_capped(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        newest = [
+            Post.objects.create(text=f'Post {number}', author=self.author)
+            for number in range(3)
+        ]
+        Follow.objects.create(user=self.stranger, author=self.author)
+        out = StringIO()
+        call_command('trim_timelines', stdout=out)
+        self.assertIn('Обрезано лент: 1', out.getvalue())
+        self.assertEqual(self.timeline_posts(), newest[:0:-1])
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.stranger).count(), 2
+        )
+
+    @override_settings(TIMELINE_LIMIT=1)
+    def test_new_post_does_not_trim_timelines(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            Post.objects.create(text='Fresh', author=self.author)
+        self.assertFalse([
+            query['sql'] for query in queries
+            if query['sql'].startswith('DELETE FROM posts_timelineentry')
+        ])
+
+    @override_settings(TIMELINE_LIMIT=1)
+    def test_trim_does_not_query_per_follower(self):
+        for user in (self.reader, self.stranger):
+            Follow.objects.create(user=user, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            trim([self.reader.pk, self.stranger.pk])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.timeline_posts(), [self.old_post])
+        Post.objects.create(text='Fresh', author=self.author)
+        trim([self.reader.pk, self.stranger.pk])
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.stranger).count(), 1
+        )
+
+    def test_feed_count_skips_entries_of_pulled_authors(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='Fresh', author=self.author)
+        cache.clear()
+        with override_settings(FANOUT_FOLLOWER_LIMIT=0):
+            response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 2)
+
+    def test_rebuild_command_restores_timeline(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        TimelineEntry.objects.all().delete()
+        TimelineEntry.objects.create(
+            user=self.stranger,
+            post=self.old_post,
+            author=self.author,
+            pub_date=self.old_post.pub_date
+        )
+        call_command('rebuild_timeline', stdout=StringIO())
+        self.assertEqual(self.timeline_posts(), [self.old_post])
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.stranger).exists()
+        )
+
+
+@override_settings(FANOUT_FOLLOWER_LIMIT=0, AUTHOR_STREAM_LIMIT=3,
+                   POSTS_LIM=4)
+class HybridFeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for number in range(5):
+            for author in cls.authors:
+                Post.objects.create(text=f'Post {number}', author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_popular_authors_are_not_fanned_out(self):
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists()
+        )
+
+    def test_feed_merges_author_streams_in_pub_date_order(self):
+        expected = list(
+            Post.objects.filter(author__following__user=self.reader)
+            .order_by('-pub_date', '-pk')
+        )
+        address = reverse('posts:follow_index')
+        page_obj = self.client.get(address).context['page_obj']
+        collected = list(page_obj)
+        while page_obj.has_next():
+            page_obj = self.client.get(
+                address, {'cursor': page_obj.paginator.next_cursor(page_obj)}
+            ).context['page_obj']
+            collected += list(page_obj)
+        self.assertEqual(collected, expected)
+        page_obj = self.client.get(
+            address,
+            {'cursor': page_obj.paginator.previous_cursor(page_obj)}
+        ).context['page_obj']
+        self.assertEqual(list(page_obj), expected[-7:-3])
+        page_obj = self.client.get(address, {'page': 2}).context['page_obj']
+        self.assertEqual(list(page_obj), expected[4:8])
+
+    def test_feed_request_does_not_recount_pulled_authors(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:follow_index'))
+        self.assertFalse([
+            query['sql'] for query in queries
+            if 'GROUP BY' in query['sql']
+            or query['sql'].startswith('INSERT')
+        ])
+
+    def test_stale_pulled_authors_are_kept_until_refresh(self):
+        refresh_pulled_authors()
+        with override_settings(FANOUT_FOLLOWER_LIMIT=1):
+            self.client.get(reverse('posts:follow_index'))
+            self.assertFalse(
+                TimelineEntry.objects.filter(user=self.reader).exists()
+            )
+            call_command('refresh_pulled_authors', stdout=StringIO())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 15
+        )
+
+    def test_demoted_authors_are_fanned_out_again(self):
+        self.assertEqual(refresh_pulled_authors(),
+                         {author.pk for author in self.authors})
+        with override_settings(FANOUT_FOLLOWER_LIMIT=1):
+            self.assertEqual(refresh_pulled_authors(), set())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 15
+        )
@@ -0,0 +1,264 @@
+import io
+import shutil
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import (SimpleUploadedFile,
+                                            TemporaryUploadedFile)
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import thumbnails, uploads
+from ..forms import PostForm
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+MB = 1024 * 1024
+ORIENTATION = 0x0112
+MAKE = 0x010F
+
+
+def image_bytes(size, image_format='JPEG', exif=None):
+    buffer = io.BytesIO()
+    image = Image.new('RGB', size, (200, 10, 10))
+    params = {'exif': exif} if exif is not None else {}
+    image.save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def upload(content, name='photo.jpg', content_type='image/jpeg'):
+    return SimpleUploadedFile(
+        name=name, content=content, content_type=content_type
+    )
+
+
+@contextmanager
+def pixel_memory():
+    """Объём растров, выделенных Pillow внутри блока, в байтах.
+
+    Pillow выделяет растры блоками; с блоком в 1 МБ сумма выделенных
+    блоков — верхняя граница пикового объёма растров.
+    """
+    block_size = Image.core.get_block_size()
+    Image.core.set_block_size(MB)
+    Image.core.reset_stats()
+    allocated = {}
+    try:
+        yield allocated
+    finally:
+        allocated['bytes'] = Image.core.get_stats()['allocated_blocks'] * MB
+        Image.core.set_block_size(block_size)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIDE=512)
+class UploadPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.large_jpeg = image_bytes((4000, 3000))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create_post(self, image):
+        self.client.post(reverse('posts:post_create'), data={
+            'text': 'Post with image', 'image': image
+        })
+        return Post.objects.get(text='Post with image')
+
+    def test_original_is_downscaled_and_size_stored(self):
+        post = self.create_post(upload(self.large_jpeg))
+        self.assertEqual((post.image_width, post.image_height), (512, 384))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (512, 384))
+
+    def test_small_image_keeps_its_size(self):
+        post = self.create_post(upload(image_bytes((300, 200), 'PNG'),
+                                       'small.png', 'image/png'))
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+        self.assertTrue(post.image.name.endswith('.png'))
+
+    def test_exif_is_stripped_and_orientation_applied(self):
+        exif = Image.Exif()
+        exif[ORIENTATION] = 6
+        exif[MAKE] = 'Camera'
+        post = self.create_post(
+            upload(image_bytes((400, 200), exif=exif.tobytes()))
+        )
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (200, 400))
+            self.assertEqual(dict(stored.getexif()), {})
+            self.assertNotIn('exif', stored.info)
+        self.assertEqual((post.image_width, post.image_height), (200, 400))
+
+    @override_settings(POST_IMAGE_MAX_BYTES=1024)
+    def test_large_file_is_rejected(self):
+        form = PostForm(data={'text': 'Text'},
+                        files={'image': upload(self.large_jpeg)})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'file_too_large')
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=10 ** 6)
+    def test_large_raster_is_rejected_before_decoding(self):
+        form = PostForm(data={'text': 'Text'},
+                        files={'image': upload(self.large_jpeg)})
+        with mock.patch.object(
+            Image.Image, 'load',
+            side_effect=AssertionError('Растр декодирован')
+        ):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'image_too_large')
+
+    @override_settings(POST_IMAGE_MAX_FULL_DECODE_PIXELS=10 ** 5)
+    def test_formats_without_draft_have_lower_limit(self):
+        png = PostForm(data={'text': 'Text'}, files={'image': upload(
+            image_bytes((400, 300), 'PNG'), 'photo.png', 'image/png'
+        )})
+        self.assertFalse(png.is_valid())
+        self.assertEqual(png.errors.as_data()['image'][0].code,
+                         'image_too_large')
+        jpeg = PostForm(data={'text': 'Text'},
+                        files={'image': upload(image_bytes((400, 300)))})
+        self.assertTrue(jpeg.is_valid(), jpeg.errors)
+
+    def test_truncated_jpeg_is_rejected(self):
+        form = PostForm(data={'text': 'Text'}, files={'image': upload(
+            self.large_jpeg[:len(self.large_jpeg) // 2]
+        )})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'invalid_image')
+
+    def test_animated_gif_is_rejected(self):
+        buffer = io.BytesIO()
+        frames = [Image.new('RGB', (20, 20), color)
+                  for color in ('red', 'blue')]
+        frames[0].save(buffer, 'GIF', save_all=True,
+                       append_images=frames[1:])
+        form = PostForm(data={'text': 'Text'}, files={'image': upload(
+            buffer.getvalue(), 'animated.gif', 'image/gif'
+        )})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'animated_image')
+
+    def test_edit_without_new_image_keeps_size(self):
+        post = self.create_post(upload(self.large_jpeg))
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Edited text'}
+        )
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (512, 384))
+
+    def test_peak_memory_is_bounded(self):
+        temporary = TemporaryUploadedFile(
+            'photo.jpg', 'image/jpeg', len(self.large_jpeg), None
+        )
+        temporary.write(self.large_jpeg)
+        form = PostForm(data={'text': 'Text'}, files={'image': temporary})
+        tracemalloc.start()
+        try:
+            with pixel_memory() as rasters:
+                self.assertTrue(form.is_valid(), form.errors)
+            python_peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            temporary.close()
+        # Полный растр 4000x3000 занял бы в Pillow 48 МБ.
+        self.assertLess(rasters['bytes'], 8 * MB)
+        self.assertLess(python_peak, 2 * MB)
+
+    def test_process_returns_downscaled_file(self):
+        image = uploads.process(upload(self.large_jpeg))
+        self.assertEqual(uploads.dimensions(image), (512, 384))
+        self.assertTrue(image.name.endswith('.jpg'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageDimensionsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='dimensions')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, size=(300, 200), exif=None):
+        return Post.objects.create(
+            text='Post', author=self.user,
+            image=upload(image_bytes(size, exif=exif))
+        )
+
+    def test_dimensions_are_filled_on_save(self):
+        post = self.create_post()
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+
+    def test_exif_rotation_is_taken_into_account(self):
+        exif = Image.Exif()
+        exif[ORIENTATION] = 8
+        post = self.create_post(exif=exif.tobytes())
+        self.assertEqual((post.image_width, post.image_height), (200, 300))
+
+    def test_removed_image_clears_dimensions(self):
+        post = self.create_post()
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertIsNone(post.image_height)
+
+    def test_backfill_fills_missing_dimensions(self):
+        post = self.create_post()
+        broken = Post.objects.create(
+            text='Broken', author=self.user, image='posts/missing.jpg'
+        )
+        Post.objects.update(image_width=None, image_height=None)
+        out = io.StringIO()
+        call_command('backfill_image_dimensions', workers=2, batch_size=1,
+                     stdout=out)
+        post.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+        self.assertIsNone(broken.image_width)
+        self.assertIn('файлы не прочитаны: 1', out.getvalue())
+
+    def test_display_size_uses_stored_dimensions(self):
+        post = Post(image='posts/photo.jpg', image_width=1000,
+                    image_height=2000)
+        presets = {'card': {'geometry': '500x500', 'upscale': False}}
+        with override_settings(POST_THUMBNAILS=presets):
+            self.assertEqual(thumbnails.display_size(post, 'card'),
+                             (250, 500))
+        self.assertEqual(thumbnails.display_size(post, 'card'), (960, 339))
+
+    def test_feed_renders_sizes_without_storage_access(self):
+        self.create_post()
+        cache.clear()
+        with mock.patch.object(
+            FileSystemStorage, 'open',
+            side_effect=AssertionError('Чтение файла при рендеринге')
+        ), mock.patch.object(
+            FileSystemStorage, 'exists',
+            side_effect=AssertionError('Проверка файла при рендеринге')
+        ):
+            response = Client().get(reverse('posts:index'))
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
@@ -0,0 +1,364 @@
+"""Фоновая генерация миниатюр изображений постов.
+
+Сохранение поста с новым изображением ставит его в очередь
+`ThumbnailTask`, а команда `generate_thumbnails` рендерит миниатюры
+в пуле процессов. Пока миниатюра не готова, шаблоны выводят заглушку,
+поэтому запрос никогда не ждёт Pillow. Неудачная задача повторяется с
+растущей задержкой, а исчерпавшая попытки видна в админке, откуда её
+можно перезапустить.
+"""
+import datetime
+import logging
+from concurrent.futures import as_completed
+
+import sorl
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import caching, sharding
+from .models import Post, ThumbnailTask
+from .storage import is_hashed
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# Имя файла и рендер миниатюры берутся из частных методов бэкенда
+# sorl-thumbnail; они сверены с этой версией из requirements.txt, и
+# обновление sorl нужно начинать с проверки обёрток ниже.
+SORL_VERSION = '12.7.0'
+
+
+def _sorl_format(source):
+    return default.backend._get_format(source)
+
+
+def _sorl_filename(source, geometry, options):
+    return default.backend._get_thumbnail_filename(source, geometry, options)
+
+
+def _sorl_create(source_image, geometry, options, thumbnail):
+    default.backend._create_thumbnail(
+        source_image, geometry, options, thumbnail
+    )
+
+
+def check_sorl_version():
+    if sorl.__version__ != SORL_VERSION:
+        logger.warning(
+            'sorl-thumbnail %s вместо %s: сверьте частные методы бэкенда',
+            sorl.__version__, SORL_VERSION
+        )
+
+
+def variants(preset_name):
+    """Варианты пресета из `POST_THUMBNAILS`: по одному на ширину и формат.
+
+    Элементы — `(ширина, формат, геометрия, параметры)`; высота
+    масштабируется пропорционально геометрии пресета.
+    """
+    options = dict(settings.POST_THUMBNAILS[preset_name])
+    options.pop('sizes', None)
+    width, height = map(int, options.pop('geometry').split('x'))
+    widths = options.pop('widths', (width,))
+    formats = options.pop('formats', (sorl_settings.THUMBNAIL_FORMAT,))
+    return [
+        (variant_width, image_format,
+         f'{variant_width}x{round(height * variant_width / width)}',
+         {**options, 'format': image_format})
+        for image_format in formats
+        for variant_width in widths
+    ]
+
+
+def thumbnail_options(source, options):
+    # Те же умолчания, что добавляет `get_thumbnail`: от них зависит имя
+    # файла миниатюры.
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', _sorl_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_file(source, geometry, options):
+    options = thumbnail_options(source, options)
+    name = _sorl_filename(source, geometry, options)
+    return ImageFile(name, default.storage), options
+
+
+def source_file(image_name):
+    """Исходник для sorl с тем же ключом, под которым он был сохранён.
+
+    Ключ метаданных и имена миниатюр sorl зависят от класса хранилища.
+    Файлы, загруженные до адресного хранилища, обрабатывались через
+    `default_storage`, поэтому для них ключ считается по нему: иначе их
+    готовые миниатюры перестали бы находиться.
+    """
+    if is_hashed(image_name):
+        return ImageFile(image_name, Post._meta.get_field('image').storage)
+    return ImageFile(image_name, default_storage)
+
+
+def variant_files(post, preset_name):
+    source = source_file(post.image.name)
+    return {
+        (width, image_format): thumbnail_file(source, geometry, options)[0]
+        for width, image_format, geometry, options in variants(preset_name)
+    }
+
+
+def _ready(posts):
+    return [post for post in posts if post.image and post.thumbnail_ready]
+
+
+def _remember(post, preset_name, keys, images):
+    post.__dict__.setdefault('_thumbnails', {})[preset_name] = {
+        key: image for key, image in zip(keys, images) if image is not None
+    }
+
+
+def prefetch(posts, preset_name):
+    """Загружает метаданные миниатюр постов одним обращением к хранилищу.
+
+    Результат запоминается в постах, и `lookup` для них уже не ходит
+    ни в кеш, ни в базу.
+    """
+    posts = _ready(posts)
+    files = [variant_files(post, preset_name) for post in posts]
+    images = iter(default.kvstore.get_many(
+        [image for post_files in files for image in post_files.values()]
+    ))
+    for post, post_files in zip(posts, files):
+        _remember(post, preset_name, list(post_files),
+                  [next(images) for _ in post_files])
+
+
+def lookup(post, preset_name):
+    """Готовые миниатюры поста по `(ширина, формат)`; файлы не открываются."""
+    if not _ready([post]):
+        return {}
+    if preset_name not in post.__dict__.get('_thumbnails', {}):
+        files = variant_files(post, preset_name)
+        _remember(post, preset_name, list(files),
+                  default.kvstore.get_many(list(files.values())))
+    return post._thumbnails[preset_name]
+
+
+def display_size(post, preset_name):
+    """Размер миниатюры по сохранённым размерам исходника, без файлов.
+
+    Повторяет расчёт sorl: с `crop` исходник заполняет геометрию
+    пресета и обрезается, без него — вписывается в неё.
+    """
+    options = settings.POST_THUMBNAILS[preset_name]
+    width, height = map(int, options['geometry'].split('x'))
+    if not post.image_width or not post.image_height:
+        return width, height
+    ratios = (width / post.image_width, height / post.image_height)
+    factor = max(ratios) if options.get('crop') else min(ratios)
+    if not options.get('upscale', sorl_settings.THUMBNAIL_UPSCALE):
+        factor = min(factor, 1)
+    return (min(width, round(post.image_width * factor)),
+            min(height, round(post.image_height * factor)))
+
+
+def picture(post, preset_name):
+    """Данные для `<picture>`: `srcset` по форматам и запасной `<img>`.
+
+    Последний формат пресета — запасной для `<img>`, остальные выводятся
+    в `<source>`. Пока миниатюры не готовы, `src` равен None, а размеры
+    нужны заглушке, чтобы страница не сдвигалась.
+    """
+    width, height = display_size(post, preset_name)
+    result = {'src': None, 'width': width, 'height': height}
+    srcsets = {}
+    for (variant_width, image_format), image in sorted(
+        lookup(post, preset_name).items()
+    ):
+        srcsets.setdefault(image_format, []).append((variant_width, image))
+    if not srcsets:
+        return result
+    formats = list(dict.fromkeys(
+        image_format for variant_width, image_format, geometry, options
+        in variants(preset_name) if image_format in srcsets
+    ))
+    fallback = srcsets[formats[-1]]
+    result.update({
+        'sources': [
+            {'type': f'image/{image_format.lower()}',
+             'srcset': _srcset(srcsets[image_format])}
+            for image_format in formats[:-1]
+        ],
+        'src': fallback[-1][1].url,
+        'srcset': _srcset(fallback),
+        'sizes': settings.POST_THUMBNAILS[preset_name].get('sizes', '100vw'),
+    })
+    return result
+
+
+def _srcset(images):
+    return ', '.join(f'{image.url} {width}w' for width, image in images)
+
+
+def enqueue(post):
+    ThumbnailTask.objects.update_or_create(post=post, defaults={
+        'attempts': 0, 'retry_at': None, 'last_error': ''
+    })
+
+
+def enqueue_many(post_ids):
+    ThumbnailTask.objects.bulk_create(
+        [ThumbnailTask(post_id=post_id) for post_id in post_ids],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def failed():
+    """Задачи, исчерпавшие `THUMBNAIL_MAX_ATTEMPTS`."""
+    return ThumbnailTask.objects.filter(
+        attempts__gte=settings.THUMBNAIL_MAX_ATTEMPTS
+    )
+
+
+def retry(tasks):
+    """Возвращает задачи в очередь с новым запасом попыток."""
+    return tasks.update(attempts=0, retry_at=None, last_error='')
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: удваивается с каждой неудачей."""
+    return datetime.timedelta(
+        seconds=settings.THUMBNAIL_RETRY_DELAY * 2 ** (attempts - 1)
+    )
+
+
+def pending(limit):
+    tasks = ThumbnailTask.objects.filter(
+        Q(retry_at__isnull=True) | Q(retry_at__lte=timezone.now()),
+        attempts__lt=settings.THUMBNAIL_MAX_ATTEMPTS
+    )
+    if not sharding.enabled():
+        return list(
+            tasks.exclude(post__image='').select_related('post')[:limit]
+        )
+    # Посты лежат в шардах: соединения нет, они подгружаются отдельно.
+    tasks = list(tasks[:limit])
+    posts = sharding.in_bulk([task.post_id for task in tasks])
+    ready, stale = [], []
+    for task in tasks:
+        post = posts.get(task.post_id)
+        if post is None or not post.image:
+            stale.append(task.pk)
+            continue
+        task.post = post
+        ready.append(task)
+    ThumbnailTask.objects.filter(pk__in=stale).delete()
+    return ready
+
+
+def render(image_name, preset_names):
+    """Создаёт файлы миниатюр; выполняется в дочернем процессе без базы.
+
+    Возвращает размер исходника и пары `(имя, размер)` миниатюр, чтобы
+    родительский процесс записал их в хранилище метаданных sorl.
+    Уже существующие файлы не пересоздаются.
+    """
+    source = source_file(image_name)
+    source_image = default.engine.get_image(source)
+    rendered = []
+    try:
+        source.set_size(default.engine.get_image_size(source_image))
+        for preset_name in preset_names:
+            for width, image_format, geometry, options in variants(
+                preset_name
+            ):
+                thumbnail, options = thumbnail_file(source, geometry, options)
+                if (sorl_settings.THUMBNAIL_FORCE_OVERWRITE
+                        or not thumbnail.exists()):
+                    options['image_info'] = default.engine.get_image_info(
+                        source_image
+                    )
+                    _sorl_create(source_image, geometry, options, thumbnail)
+                else:
+                    thumbnail.set_size()
+                rendered.append((thumbnail.name, thumbnail.size))
+    finally:
+        default.engine.cleanup(source_image)
+    return source.size, rendered
+
+
+def store(post, source_size, rendered):
+    source = source_file(post.image.name)
+    source.set_size(source_size)
+    default.kvstore.get_or_set(source)
+    for name, size in rendered:
+        thumbnail = ImageFile(name, default.storage)
+        thumbnail.set_size(size)
+        default.kvstore.set(thumbnail, source)
+
+
+def complete(task, source_size, rendered):
+    post = task.post
+    store(post, source_size, rendered)
+    # Условный UPDATE вместо проверки и `save()`: если изображение
+    # заменили, пока рендерилась миниатюра, пост не отмечается готовым,
+    # а задача уже поставлена заново. `updated_at` меняется, чтобы
+    # карточка с новыми вариантами перерисовалась и при повторной
+    # генерации.
+    if not sharding.author_posts(post.author_id).filter(
+        pk=post.pk, image=post.image.name
+    ).update(thumbnail_ready=True, updated_at=timezone.now()):
+        return False
+    post.thumbnail_ready = True
+    caching.invalidate_post_pages(post)
+    ThumbnailTask.objects.filter(
+        pk=task.pk, created=task.created
+    ).delete()
+    return True
+
+
+def fail(task, error):
+    attempts = task.attempts + 1
+    ThumbnailTask.objects.filter(pk=task.pk, created=task.created).update(
+        attempts=F('attempts') + 1,
+        retry_at=timezone.now() + retry_delay(attempts),
+        last_error=f'{type(error).__name__}: {error}'
+    )
+
+
+def process(tasks, executor):
+    """Рендерит миниатюры задач в `executor` и отмечает посты готовыми.
+
+    Возвращает количество готовых постов и количество ошибок.
+    """
+    preset_names = list(settings.POST_THUMBNAILS)
+    futures = {
+        executor.submit(render, task.post.image.name, preset_names): task
+        for task in tasks
+    }
+    done = errors = 0
+    for future in as_completed(futures):
+        task = futures[future]
+        try:
+            source_size, rendered = future.result()
+        except Exception as error:
+            logger.exception('Не удалось создать миниатюры поста %s',
+                             task.post_id)
+            fail(task, error)
+            errors += 1
+            continue
+        done += complete(task, source_size, rendered)
+    return done, errors
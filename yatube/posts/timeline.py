@@ -0,0 +1,326 @@
+"""Лента подписок: fan-out on write с pull-моделью для популярных авторов.
+
+Пост автора, у которого не больше `FANOUT_FOLLOWER_LIMIT` подписчиков,
+сразу раскладывается в ленты подписчиков (`TimelineEntry`), поэтому
+`follow_index` читает одну таблицу по индексу `(user, pub_date)`.
+Посты популярных авторов в ленты не пишутся: при чтении они берутся из
+закешированных потоков авторов и сливаются с лентой k-way merge.
+
+Новый пост не обрезает ленты подписчиков: до `TIMELINE_LIMIT` их
+обрезает команда `trim_timelines`, запускаемая по расписанию.
+"""
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import CursorPaginator
+
+BATCH_SIZE = 500
+PULLED_AUTHORS_KEY = 'timeline:pulled-authors'
+STREAM_KEY = 'timeline:author-stream:{}'
+
+
+def _entry(user_id, post):
+    return TimelineEntry(
+        user_id=user_id,
+        post_id=post.pk,
+        author_id=post.author_id,
+        pub_date=post.pub_date
+    )
+
+
+def follower_count(author_id):
+    return UserStats.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def refresh_pulled_authors():
+    """Пересчитывает популярных авторов по таблице подписок.
+
+    Запускается командой `refresh_pulled_authors` по расписанию, а не в
+    запросе: `GROUP BY` идёт по всем подпискам. Автор, у которого
+    подписчиков стало не больше порога, снова раскладывает посты по
+    лентам, поэтому его посты, пропущенные за время pull-модели,
+    дописываются в ленты подписчиков.
+    """
+    previous = cache.get(PULLED_AUTHORS_KEY) or set()
+    pulled = set(
+        Follow.objects.values('author_id').annotate(
+            followers=Count('pk')
+        ).filter(
+            followers__gt=settings.FANOUT_FOLLOWER_LIMIT
+        ).values_list('author_id', flat=True)
+    )
+    cache.set(PULLED_AUTHORS_KEY, pulled, None)
+    for author_id in previous - pulled:
+        for user_id in Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True):
+            backfill(user_id, author_id)
+    return pulled
+
+
+def pulled_authors():
+    """Авторы, чьи посты читаются из потоков, а не из лент.
+
+    Набор в кеше не истекает и до следующего пересчёта остаётся прежним.
+    Если его вытеснили, он берётся из счётчиков подписчиков, без
+    `GROUP BY` по подпискам и без дописывания лент.
+    """
+    pulled = cache.get(PULLED_AUTHORS_KEY)
+    if pulled is None:
+        pulled = set(UserStats.objects.filter(
+            followers_count__gt=settings.FANOUT_FOLLOWER_LIMIT
+        ).values_list('pk', flat=True))
+        cache.add(PULLED_AUTHORS_KEY, pulled, None)
+    return pulled
+
+
+def mark_pulled(author_id):
+    pulled = pulled_authors()
+    if author_id not in pulled:
+        cache.set(PULLED_AUTHORS_KEY, pulled | {author_id}, None)
+
+
+def _load_stream(author_id):
+    return list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-pk')
+        .values_list('pub_date', 'pk')[:settings.AUTHOR_STREAM_LIMIT]
+    )
+
+
+def author_streams(author_ids):
+    """Последние посты авторов как списки ключей `(pub_date, post_id)`.
+
+    Потоки читаются из кеша одним `get_many`, промахи загружаются из
+    базы и записываются одним `set_many`.
+    """
+    keys = {STREAM_KEY.format(author_id): author_id
+            for author_id in author_ids}
+    streams = {
+        keys[key]: stream for key, stream in cache.get_many(keys).items()
+    }
+    missing = {
+        key: _load_stream(author_id) for key, author_id in keys.items()
+        if author_id not in streams
+    }
+    if missing:
+        cache.set_many(missing, settings.AUTHOR_STREAM_TIMEOUT)
+        streams.update(
+            (keys[key], stream) for key, stream in missing.items()
+        )
+    return streams
+
+
+def push_to_stream(post):
+    key = STREAM_KEY.format(post.author_id)
+    stream = cache.get(key)
+    if stream is not None:
+        stream = [(post.pub_date, post.pk)] + stream
+        cache.set(key, stream[:settings.AUTHOR_STREAM_LIMIT],
+                  settings.AUTHOR_STREAM_TIMEOUT)
+
+
+def drop_stream(author_id):
+    cache.delete(STREAM_KEY.format(author_id))
+
+
+def trim(user_ids):
+    """Оставляет в лентах не больше `TIMELINE_LIMIT` записей.
+
+    Лишние записи всех лент пачки удаляются одним `DELETE` с номером
+    строки в ленте, без отдельных запросов на каждого подписчика.
+    """
+    table = TimelineEntry._meta.db_table
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(batch))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ('
+                f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+                f'PARTITION BY user_id ORDER BY pub_date DESC, '
+                f'post_id DESC) AS position FROM {table} '
+                f'WHERE user_id IN ({placeholders})) '
+                f'WHERE position > %s)',
+                [*batch, settings.TIMELINE_LIMIT]
+            )
+
+
+def overflowing_users():
+    """Читатели, в лентах которых больше `TIMELINE_LIMIT` записей."""
+    return list(
+        TimelineEntry.objects.order_by().values('user_id').annotate(
+            entries=Count('pk')
+        ).filter(
+            entries__gt=settings.TIMELINE_LIMIT
+        ).values_list('user_id', flat=True)
+    )
+
+
+def fan_out(post):
+    push_to_stream(post)
+    if follower_count(post.author_id) > settings.FANOUT_FOLLOWER_LIMIT:
+        mark_pulled(post.author_id)
+        return
+    follower_ids = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+    )
+    TimelineEntry.objects.bulk_create(
+        [_entry(user_id, post) for user_id in follower_ids],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    if author_id in pulled_authors():
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        'pk', 'author_id', 'pub_date'
+    )[:settings.TIMELINE_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        [_entry(user_id, post) for post in posts],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    trim([user_id])
+
+
+def remove(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    posts = Post.objects.filter(author__following__user_id=user_id).exclude(
+        author_id__in=pulled_authors()
+    ).only(
+        'pk', 'author_id', 'pub_date'
+    ).order_by('-pub_date', '-pk')[:settings.TIMELINE_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        [_entry(user_id, post) for post in posts],
+        batch_size=BATCH_SIZE
+    )
+
+
+def followed_pulled_authors(user):
+    return list(
+        Follow.objects.filter(
+            user=user, author_id__in=pulled_authors()
+        ).values_list('author_id', flat=True)
+    )
+
+
+def posts_of(entries):
+    return [entry.post for entry in entries]
+
+
+def feed(user):
+    return TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
+
+
+def load_posts(keys):
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [post_id for pub_date, post_id in keys]
+    )
+    return [posts[post_id] for pub_date, post_id in keys if post_id in posts]
+
+
+class HybridFeedPaginator(CursorPaginator):
+    """Лента подписок, собранная k-way merge из ленты и потоков авторов.
+
+    `object_list` — записи `TimelineEntry` читателя, `pulled_ids` —
+    популярные авторы, на которых он подписан. Элементы страницы —
+    ключи `(pub_date, post_id)`, посты подгружаются одним `in_bulk`.
+    """
+
+    ordering = TimelineEntry._meta.ordering
+
+    def __init__(self, object_list, per_page, pulled_ids=(), **kwargs):
+        kwargs.setdefault('transform', load_posts)
+        super().__init__(object_list.values_list('pub_date', 'post_id'),
+                         per_page, **kwargs)
+        self.pulled_ids = list(pulled_ids)
+
+    def cursor_key(self, obj):
+        return list(obj)
+
+    def _author_keys(self, author_id, stream, values, reverse, limit):
+        complete = len(stream) < settings.AUTHOR_STREAM_LIMIT
+        if values is None:
+            keys = stream[:limit]
+        elif reverse:
+            if complete or (stream and tuple(values) >= stream[-1]):
+                return [key for key in reversed(stream)
+                        if key > tuple(values)][:limit]
+            keys = []
+        else:
+            keys = [key for key in stream if key < tuple(values)][:limit]
+        if complete or len(keys) == limit:
+            return keys
+        # Страница выходит за пределы закешированного потока.
+        return self._author_keys_from_db(author_id, values, reverse, limit)
+
+    @staticmethod
+    def _author_keys_from_db(author_id, values, reverse, limit):
+        posts = Post.objects.filter(author_id=author_id)
+        if values is None:
+            posts = posts.order_by('-pub_date', '-pk')
+        elif reverse:
+            pub_date, post_id = values
+            posts = posts.filter(
+                Q(pub_date__gt=pub_date)
+                | Q(pub_date=pub_date, pk__gt=post_id)
+            ).order_by('pub_date', 'pk')
+        else:
+            pub_date, post_id = values
+            posts = posts.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, pk__lt=post_id)
+            ).order_by('-pub_date', '-pk')
+        return list(posts.values_list('pub_date', 'pk')[:limit])
+
+    def fetch(self, values, reverse, limit):
+        if values is None:
+            sources = [self.object_list[:limit]]
+        else:
+            sources = [super().fetch(values, reverse, limit)]
+        sources += [
+            self._author_keys(author_id, stream, values, reverse, limit)
+            for author_id, stream in author_streams(self.pulled_ids).items()
+        ]
+        keys, seen = [], set()
+        for pub_date, post_id in heapq.merge(*sources, reverse=not reverse):
+            if post_id in seen:
+                continue
+            seen.add(post_id)
+            keys.append((pub_date, post_id))
+            if len(keys) == limit:
+                break
+        return keys
+
+    def exact_count(self):
+        # Посты, разложенные в ленту до того, как автор стал популярным,
+        # есть и в ленте, и в его потоке, и считаются один раз.
+        return self.object_list.exclude(
+            author_id__in=self.pulled_ids
+        ).count() + Post.objects.filter(
+            author_id__in=self.pulled_ids
+        ).count()
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        items = self.fetch(None, False, bottom + self.per_page)[bottom:]
+        return self._get_page(items, number, self)
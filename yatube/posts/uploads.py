@@ -0,0 +1,120 @@
+"""Обработка загруженных изображений постов с ограниченной памятью.
+
+Django принимает загрузку кусками: большие файлы пишутся во временный
+файл на диске. Дальше изображение проверяется по размеру файла и по
+размерам из заголовка, то есть до декодирования пикселей. Исходник
+уменьшается до `POST_IMAGE_MAX_SIDE`; JPEG сразу декодируется в
+уменьшенном масштабе (`draft`), поэтому полноразмерный растр в памяти
+не появляется. Остальные форматы так не умеют и декодируются целиком,
+поэтому для них действует меньший предел
+`POST_IMAGE_MAX_FULL_DECODE_PIXELS`. Анимированные изображения
+отклоняются: сохранился бы только первый кадр. Ориентация из EXIF
+применяется к пикселям, а сами метаданные EXIF в сохранённый файл не
+попадают.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files import File
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+KEPT_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+FALLBACK_FORMAT = 'PNG'
+ORIENTATION = 0x0112
+# Значения тега ориентации EXIF, при которых изображение поворачивается
+# на 90 градусов.
+ROTATED = {5, 6, 7, 8}
+
+
+def max_pixels(image_format):
+    if image_format == 'JPEG':
+        return settings.POST_IMAGE_MAX_PIXELS
+    return min(settings.POST_IMAGE_MAX_PIXELS,
+               settings.POST_IMAGE_MAX_FULL_DECODE_PIXELS)
+
+
+def check_limits(upload):
+    """Отклоняет слишком большой файл или растр, не декодируя его."""
+    if upload.size > settings.POST_IMAGE_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': filesizeformat(settings.POST_IMAGE_MAX_BYTES)}
+        )
+    width, height = upload.image.size
+    limit = max_pixels(upload.image.format)
+    if width * height > limit:
+        raise ValidationError(
+            'Изображение больше %(limit)s мегапикселей.',
+            code='image_too_large',
+            params={'limit': limit // 10 ** 6}
+        )
+    upload.seek(0)
+    with Image.open(upload) as header:
+        animated = getattr(header, 'is_animated', False)
+    if animated:
+        raise ValidationError(
+            'Анимированные изображения не поддерживаются.',
+            code='animated_image'
+        )
+
+
+def dimensions(image):
+    """Размеры изображения на экране; читается только заголовок файла.
+
+    Учитывает поворот из EXIF. Возвращает `(None, None)`, если файл
+    недоступен или не является изображением.
+    """
+    close = image.closed
+    try:
+        image.open('rb')
+        with Image.open(image) as header:
+            width, height = header.size
+            if header.getexif().get(ORIENTATION) in ROTATED:
+                width, height = height, width
+    except (OSError, ValueError, SuspiciousFileOperation):
+        return None, None
+    finally:
+        if close:
+            image.close()
+    return width, height
+
+
+def _fit(size, max_side):
+    width, height = size
+    scale = min(1, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def process(upload):
+    """Уменьшенная копия загрузки без EXIF.
+
+    Результат пишется во временный файл, который остаётся в памяти,
+    только пока он меньше `FILE_UPLOAD_MAX_MEMORY_SIZE`.
+    """
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    upload.seek(0)
+    with Image.open(upload) as source:
+        image_format = source.format
+        if image_format not in KEPT_FORMATS:
+            image_format = FALLBACK_FORMAT
+        source.draft(source.mode, _fit(source.size, max_side))
+        source.thumbnail((max_side, max_side))
+        image = ImageOps.exif_transpose(source)
+    params = {}
+    if image.info.get('icc_profile'):
+        params['icc_profile'] = image.info['icc_profile']
+    if image_format in ('JPEG', 'WEBP'):
+        params['quality'] = settings.POST_IMAGE_QUALITY
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    image.save(output, image_format, **params)
+    output.seek(0)
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return File(output, name=name + KEPT_FORMATS[image_format])
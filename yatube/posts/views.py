@@ -1,31 +1,37 @@
-from django.conf import settings
+from urllib.parse import urlencode
+
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from . import counters, search, sharding, timeline
+from .conditional import conditional
+from .caching import (author_scope, cache_versioned, count_key, group_scope,
+                      index_scope, post_scope)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Follow, Group, Post, TimelineEntry, User
+from .paginators import paginate
 
 
-@cache_page(settings.CACHE_TIME)
+@cache_versioned(index_scope)
 def index(request):
-    all_posts = Post.objects.all()
-    paginator = Paginator(all_posts, settings.POSTS_LIM)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    all_posts = Post.objects.select_related('author', 'group')
+    page_obj = paginate(request, all_posts,
+                        count_key=count_key(index_scope(request)),
+                        **sharding.feed_options())
     context = {
         'page_obj': page_obj
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional(group_scope)
+@cache_versioned(group_scope)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    group_posts = group.posts.all()
-    paginator = Paginator(group_posts, settings.POSTS_LIM)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group_posts = group.posts.select_related('author', 'group')
+    page_obj = paginate(request, group_posts,
+                        count_key=count_key(group_scope(request, slug)),
+                        **sharding.feed_options())
     context = {
         'group': group,
         'page_obj': page_obj
@@ -33,35 +39,64 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional(author_scope)
+@cache_versioned(author_scope)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    author_posts = author.posts.all()
-    post_count = author_posts.count()
-    paginator = Paginator(author_posts, settings.POSTS_LIM)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username
+    )
+    author_posts = author.posts.select_related('author', 'group')
+    stats = counters.stats_of(author)
+    page_obj = paginate(request, author_posts,
+                        count_key=count_key(author_scope(request, username)),
+                        **sharding.feed_options(author_ids=[author.pk]))
     following = (request.user.is_authenticated and request.user != author
                  and Follow.objects.filter(author=author,
                                            user=request.user).exists())
     context = {
         'author': author,
         'page_obj': page_obj,
-        'post_count': post_count,
+        'post_count': stats.posts_count,
+        'stats': stats,
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+@cache_versioned(index_scope, name='search')
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = paginate(
+            request,
+            search.matching(query).select_related('author', 'group'),
+            paginator_class=(search.ShardedSearchPaginator
+                             if sharding.enabled()
+                             else search.SearchPaginator),
+            query=query
+        )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'extra_query': urlencode({'q': query}) + '&'
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@conditional(post_scope)
+@cache_versioned(post_scope)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    author_posts = post.author.posts.all()
-    post_comments = post.comments.all()
-    post_count = author_posts.count()
+    post = sharding.get_post_or_404(
+        post_id, Post.objects.select_related('author__stats', 'group')
+    )
+    post_comments = sharding.local(post.comments.select_related('author'))
     form = CommentForm()
     context = {
         'post': post,
         'post_author': post.author,
-        'post_count': post_count,
+        'post_count': counters.stats_of(post.author).posts_count,
         'form': form,
         'post_comments': post_comments
     }
@@ -84,7 +119,7 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.get_post_or_404(post_id)
     if post.author != request.user:
         return redirect('posts:post_detail', post_id=post_id)
     form = PostForm(
@@ -105,7 +140,7 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.get_post_or_404(post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -117,10 +152,32 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, settings.POSTS_LIM)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    pulled_ids = timeline.followed_pulled_authors(request.user)
+    if sharding.enabled():
+        # Записи ленты ссылаются на посты разных шардов, поэтому лента
+        # собирается прямо из шардов авторов.
+        author_ids = Follow.objects.filter(
+            user=request.user
+        ).values_list('author_id', flat=True)
+        page_obj = paginate(
+            request,
+            Post.objects.select_related('author', 'group'),
+            **sharding.feed_options(author_ids=list(author_ids))
+        )
+    elif pulled_ids:
+        page_obj = paginate(
+            request,
+            TimelineEntry.objects.filter(user=request.user),
+            paginator_class=timeline.HybridFeedPaginator,
+            pulled_ids=pulled_ids
+        )
+    else:
+        page_obj = paginate(
+            request,
+            timeline.feed(request.user),
+            ordering=TimelineEntry._meta.ordering,
+            transform=timeline.posts_of
+        )
     context = {
         'page_obj': page_obj
     }
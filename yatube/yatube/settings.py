@@ -33,6 +33,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.replicas.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,7 +70,55 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Соединение живёт между запросами, а не открывается заново.
+        'CONN_MAX_AGE': 60,
+    },
+    # Локальная реплика — копия основной базы (sync_replicas).
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
+    # Шарды постов и комментариев (POST_SHARDS). Схема создаётся
+    # командой `migrate --database shard_0`.
+    'shard_0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.shard0.sqlite3'),
+        'CONN_MAX_AGE': 60,
+    },
+    'shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.shard1.sqlite3'),
+        'CONN_MAX_AGE': 60,
+    },
+}
+
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.replicas.PrimaryReplicaRouter',
+]
+
+# Алиасы из DATABASES, по которым распределяются посты и комментарии
+# авторов. Пустой список — всё хранится в основной базе. После
+# изменения списка данные переносит команда `rebalance_posts`.
+POST_SHARDS = []
+
+# Алиасы из DATABASES, с которых читаются данные. Пустой список — всё
+# идёт в основную базу.
+DATABASE_REPLICAS = []
+
+# Сколько секунд после записи пользователь читает из основной базы.
+REPLICA_PIN_SECONDS = 5
+
+# Применяются к каждому новому соединению с SQLite (core.db).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер кеша страниц в КиБ.
+    'cache_size': -20000,
 }
 
 
@@ -116,13 +165,94 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+TEST_RUNNER = 'core.runner.TemporaryCacheRunner'
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
-    }
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOG': 'invalidation',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 30,
+            'SYNC_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.AtomicFileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Журнал инвалидации L1: отдельно от страниц, чтобы их вытеснение не
+    # удаляло записи журнала.
+    'invalidation': {
+        'BACKEND': 'core.cache.AtomicFileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'invalidation'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
 
-CACHE_TIME = 20
+CACHE_TIME = 60 * 60
+
+PAGE_CACHE = {
+    'default': {'TTL': CACHE_TIME, 'GRACE': 60},
+    'index': {'TTL': CACHE_TIME, 'GRACE': 5 * 60},
+}
+
+PAGE_CACHE_LOCK_TIMEOUT = 30
+
+PAGE_CACHE_STATS_INTERVAL = 60
 
 POSTS_LIM = 10
+
+# Число постов в ленте главной, групп и профиля хранится в кеше до изменения
+# ленты, но не дольше `FEED_COUNT_TIMEOUT` секунд. Неотфильтрованная
+# лента длиннее `FEED_COUNT_ESTIMATE_ABOVE` постов не считается, а
+# оценивается.
+FEED_COUNT_TIMEOUT = 5 * 60
+
+FEED_COUNT_ESTIMATE_ABOVE = 100000
+
+TIMELINE_LIMIT = 1000
+
+FANOUT_FOLLOWER_LIMIT = 1000
+
+AUTHOR_STREAM_LIMIT = 200
+
+AUTHOR_STREAM_TIMEOUT = 60 * 60 * 24
+
+POST_CARD_CACHE_TIME = 60 * 60 * 24
+
+# Миниатюры изображений постов: геометрия задаёт пропорции, для каждой
+# ширины из `widths` создаётся файл в каждом формате из `formats`.
+# Последний формат — запасной для браузеров без поддержки остальных.
+POST_THUMBNAILS = {
+    'card': {
+        'geometry': '960x339',
+        'crop': 'center',
+        'upscale': True,
+        'widths': (320, 640, 960),
+        'formats': ('WEBP', 'JPEG'),
+        'sizes': '(min-width: 992px) 960px, 100vw',
+    },
+}
+THUMBNAIL_MAX_ATTEMPTS = 3
+
+# Задержка перед повтором неудачной генерации миниатюр, в секундах;
+# удваивается с каждой попыткой.
+THUMBNAIL_RETRY_DELAY = 60
+THUMBNAIL_KVSTORE = 'core.kvstore.KVStore'
+
+# Ограничения и обработка загружаемых изображений постов.
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+# PNG, GIF и WebP, в отличие от JPEG, не декодируются в уменьшенном
+# масштабе, и их растр целиком оказывается в памяти (4 байта на пиксель).
+POST_IMAGE_MAX_FULL_DECODE_PIXELS = 12 * 10 ** 6
+POST_IMAGE_MAX_SIDE = 2048
+POST_IMAGE_QUALITY = 85